@@ -2,13 +2,19 @@ import re
 import dataclasses
 import os
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary
+from playwright.sync_api import ViewportSize
+from detail_cache import DetailCache, fingerprint
+from page_pool import PagePool
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_monthly, parse_price
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log, offer_summary
 
 
 BASE_DIR = Path(__file__).parent.parent
 IMAGE_DIR = BASE_DIR / "public" / "images" / "3"
 DATA_DIR  = BASE_DIR / "data" / "3"
+DETAIL_CACHE_PATH = DATA_DIR / "3_detail_cache.json"
 VIEWPORT: ViewportSize = {"width": 1920, "height": 1080}
 
 BASE_URL = "https://www.3.dk"
@@ -37,6 +43,10 @@ HEADLESS = os.environ.get("CI") == "true"
 
 KR_PATTERN = r"(\d{1,3}(?:\.\d{3})+|\d{4,})[\s\xa0]*kr"
 
+# the text of the listing card a product link sits in (name, price, discount badge), used to tell whether the
+# product changed since its page was last scraped
+CARD_TEXT_JS = "a => (a.closest('article, li, [class*=\"card\" i]') || a).innerText"
+
 
 @dataclasses.dataclass
 class Offer:
@@ -55,13 +65,6 @@ class Offer:
     saved_at: str = ""
 
 
-def parse_price(text: str) -> int | None:
-    if not text:
-        return None
-    digits = re.sub(r"[\D.]", "", text)
-    return int(digits) if digits else None
-
-
 def download_image(image_url: str, product_name: str) -> str:
     return download_image_cached(image_url, product_name, IMAGE_DIR, "/images/3")
 
@@ -112,17 +115,14 @@ def extract_subscription_info(page) -> tuple[int | None, int | None, int | None]
 
     subscription_price_monthly = None
     for text in page.locator(r"text=/\d+\s*kr\.?\/md/").all_text_contents():
-        match = re.search(r"([\d.]+)\s*kr\.?/md", text)
-        if match:
-            subscription_price_monthly = int(match.group(1).replace(".", ""))
+        subscription_price_monthly = parse_monthly(text)
+        if subscription_price_monthly is not None:
             break
 
     min_cost_6_months = None
     mindste_el = page.locator("text=/Mindstepris/").first
     if mindste_el.count():
-        numbers = re.findall(r"(\d{1,3}(?:\.\d{3})+|\d+)", mindste_el.text_content() or "")
-        if numbers:
-            min_cost_6_months = int(numbers[-1].replace(".", ""))
+        min_cost_6_months = parse_min_cost(mindste_el.text_content())
 
     return discount_on_product, subscription_price_monthly, min_cost_6_months
 
@@ -130,7 +130,7 @@ def extract_subscription_info(page) -> tuple[int | None, int | None, int | None]
 def scrape_product_page(page, url: str, saved_at: str, product_type: str = "phone") -> Offer | None:
     try:
         page.goto(url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(1500)
+        wait_until_ready(page, "3 product", 1500, selector="h1", dom_stable_ms=300)
     except Exception as e:
         log(f"  [WARN] Could not load {url}: {e}")
         return None
@@ -182,21 +182,23 @@ def scrape_product_page(page, url: str, saved_at: str, product_type: str = "phon
     )
 
 
-def collect_product_links(page) -> list[tuple[str, str]]:
+def collect_product_links(page) -> list[tuple[str, str, str]]:
+    # (url, product type, listing card text) for every product on the category pages
     seen_urls: set[str] = set()
-    product_links: list[tuple[str, str]] = []
+    product_links: list[tuple[str, str, str]] = []
 
     for cat_url, product_type in CATEGORY_URLS.items():
         log(f"Scanning category: {cat_url}")
         try:
             page.goto(cat_url, wait_until="networkidle", timeout=30000)
-            page.wait_for_timeout(2000)
+            wait_until_ready(page, "3 category", 2000, selector='a[href*="/shop/mobiler/"], a[href*="/shop/tablets/"]')
         except Exception as e:
             log(f"  [WARN] Could not load {cat_url}: {e}")
             continue
 
         page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        page.wait_for_timeout(1500)
+        # lazy-loaded cards are in once the page stops changing
+        wait_until_ready(page, "3 category scroll", 1500, dom_stable_ms=400)
 
         link_selector = 'a[href*="/shop/mobiler/"], a[href*="/shop/tablets/"]'
         for anchor in page.query_selector_all(link_selector):
@@ -206,40 +208,74 @@ def collect_product_links(page) -> list[tuple[str, str]]:
                 full_url = f"{BASE_URL}{href}" if href.startswith("/") else href
                 if full_url not in seen_urls:
                     seen_urls.add(full_url)
-                    product_links.append((full_url, product_type))
+                    product_links.append((full_url, product_type, anchor.evaluate(CARD_TEXT_JS) or ""))
 
     return product_links
 
 
-def scrape_3():
+def make_page(browser):
+    context = browser.new_context(
+        user_agent=(
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0.0.0 Safari/537.36"
+        ),
+        viewport=VIEWPORT,
+        locale="da-DK",
+    )
+    context.add_cookies(CONSENT_COOKIES)  # type: ignore[arg-type]
+    block_unneeded_requests(context, "3")
+    return context, context.new_page()
+
+
+def scrape_3(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     saved_at = now_timestamp()
     all_offers: list[Offer] = []
     seen_names: set[str] = set()
+    cache = DetailCache(DETAIL_CACHE_PATH)
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=HEADLESS)
-        context = browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-            viewport=VIEWPORT,
-            locale="da-DK",
-        )
-        context.add_cookies(CONSENT_COOKIES)  # type: ignore[arg-type]
-        page = context.new_page()
-
-        product_links = collect_product_links(page)
+    with browser_session(browser, headless=HEADLESS) as browser:
+        context, page = make_page(browser)
+        try:
+            product_links = collect_product_links(page)
+        finally:
+            context.close()
         log(f"\nFound {len(product_links)} unique product pages\n")
 
-        for url, product_type in product_links:
+        # products whose listing card hasn't changed reuse the offer scraped from their page last time
+        offers: list[Offer | None] = []
+        card_prints: dict[str, str] = {}
+        to_visit: list[tuple[int, str, str]] = []
+        for url, product_type, card_text in product_links:
+            card_prints[url] = fingerprint(url, product_type, card_text)
+            cached = cache.get(url, card_prints[url])
+            if cached is not None:
+                log(f"Unchanged: {url}")
+                offers.append(Offer(**(cached | {"saved_at": saved_at})))
+            else:
+                to_visit.append((len(offers), url, product_type))
+                offers.append(None)
+
+        def visit(page, item: tuple[int, str, str]) -> Offer | None:
+            _, url, product_type = item
             log(f"Scraping: {url}")
-            offer = scrape_product_page(page, url, saved_at, product_type)
-            if offer and offer.product_name not in seen_names and "brugt" not in offer.product_name.lower():
-                seen_names.add(offer.product_name)
-                all_offers.append(offer)
+            return scrape_product_page(page, url, saved_at, product_type)
+
+        pool = PagePool(browser, make_page, name="3", domain="3.dk", headless=HEADLESS)
+        for (index, url, _), offer in zip(to_visit, pool.map(to_visit, visit)):
+            offers[index] = offer
+            if offer:
+                cache.put(url, card_prints[url], dataclasses.asdict(offer))
+
+    for offer in offers:
+        if offer and offer.product_name not in seen_names and "brugt" not in offer.product_name.lower():
+            seen_names.add(offer.product_name)
+            all_offers.append(offer)
+
+    cache.prune({url for url, _, _ in product_links})
+    cache.save()
+    log(f"\nProduct pages reused from the last run: {cache.hits}, visited: {cache.misses}")
 
     output_path = DATA_DIR / "3_offers.json"
     write_json(output_path, [dataclasses.asdict(o) for o in all_offers])
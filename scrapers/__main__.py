@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+# the scrapers import each other as top-level modules (they are also run as plain scripts), so put this
+# directory on the path before handing over to the orchestrator
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from orchestrator import main  # noqa: E402
+
+raise SystemExit(main())
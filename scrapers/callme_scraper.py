@@ -1,9 +1,15 @@
 import re
 import os
+import json
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from typing import TYPE_CHECKING, Any
-from playwright.sync_api import sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary, apply_name_substitutions
+from checkpoint import Checkpoint
+from detail_cache import fingerprint
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_monthly, parse_price, parse_promo
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, http_session, now_timestamp, write_json, json_array_writer, log, warn, offer_summary, apply_name_substitutions
 
 if TYPE_CHECKING:
     SetCookieParam = Any
@@ -13,6 +19,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 CALLME_DATA_DIR = BASE_DIR / "data" / "callme"
 CALLME_IMAGE_DIR = BASE_DIR / "public" / "images" / "callme"
 CALLME_OUTPUT_FILE = CALLME_DATA_DIR / "callme_offers.json"
+# the catalog/search calls each category page makes, as captured by the last browser run
+SEARCH_REQUESTS_FILE = CALLME_DATA_DIR / "callme_search_requests.json"
+
+# "direct" replays the captured search calls over HTTP and only falls back to the browser for categories where that
+# fails, "browser" always renders the pages
+CALLME_MODE = os.environ.get("CALLME_MODE", "direct")
 
 BASE_URL = "https://www.callme.dk"
 
@@ -30,6 +42,17 @@ CONSENT_COOKIES: list[dict[str, str]] = [
     {"name": "CookieInformationConsent", "value": "true", "domain": ".callme.dk", "path": "/"},
 ]
 
+# query/body fields the search endpoint could page with, and where the total hit count could be reported
+PAGE_PARAMS = ("page", "pageIndex", "pageNumber")
+TOTAL_FIELDS = ("totalHits", "total", "totalCount", "nbHits")
+MAX_PAGES = 20
+# fields that identify a hit, for telling a new results page from one the endpoint served again
+HIT_ID_FIELDS = ("objectID", "id", "productId", "sku")
+
+# the only request headers kept with a captured search call. the file is committed, so anything tied to the browser
+# session (cookies, authorization, session or csrf tokens) must never end up in it
+PERSISTED_HEADERS = {"accept", "accept-language", "content-type", "origin", "referer", "user-agent", "x-requested-with"}
+
 
 def get_product_type_from_api_category(api_category, product_name=""):
     # CallMe's API has a very inconsistent productCategory field
@@ -79,49 +102,6 @@ def download_image(image_url, product_name):
     )
 
 
-def parse_price(text):
-    # extract integer price from a string like '4.499 kr.' or '3.199 kr.'
-    if not text:
-        return None
-    cleaned = re.sub(r"\D", "", text.replace(".", ""))
-    try:
-        return int(cleaned)
-    except ValueError:
-        return None
-
-
-def parse_min_cost(minimum_price_text):
-    # extract the mindstepris number, e.g. 5.022 from "Mindstepris 5.022 kr. med ..."
-    if not minimum_price_text:
-        return None
-    m = re.search(r"Mindstepris\s+([\d.]+)\s*kr", minimum_price_text, re.IGNORECASE)
-    if m:
-        return int(m.group(1).replace(".", ""))
-    return None
-
-
-def parse_monthly_prices(minimum_price_text):
-    # extract monthly prices from the mindstepris string
-    # e.g. "... 79 kr. i 6 mdr. herefter 129 kr." -> (79, 6, 129)
-    if not minimum_price_text:
-        return None, None, None
-
-    m = re.search(
-        r"([\d.]+)\s*kr\.?\s+i\s+(\d+)\s+mdr?\.?\s+herefter\s+([\d.]+)\s*kr",
-        minimum_price_text,
-        re.IGNORECASE,
-    )
-    if m:
-        return int(m.group(1).replace(".", "")), int(m.group(2)), int(m.group(3).replace(".", ""))
-
-    # simpler fallback: just "X kr./md"
-    m2 = re.search(r"([\d.]+)\s*kr\.?/md", minimum_price_text, re.IGNORECASE)
-    if m2:
-        return int(m2.group(1).replace(".", "")), None, None
-
-    return None, None, None
-
-
 def normalize_product_name(name):
     # Keep product title up to the storage token and drop color/other trailing descriptors.
     if not name:
@@ -149,17 +129,20 @@ def build_entry(hit, product_type, date_time, use_api_category=False):
     full_price_text = hit.get("fullPrice", "")
     minimum_price_text = hit.get("minimumPrice", "")
 
+    # e.g. "Mindstepris 5.022 kr. med ... 79 kr. i 6 mdr. herefter 129 kr."
     price_with_subscription = parse_price(full_price_text)
     min_cost_6_months = parse_min_cost(minimum_price_text)
-    promo_price, promo_months, regular_price = parse_monthly_prices(minimum_price_text)
+    promo = parse_promo(minimum_price_text)
+    regular_price = promo.regular_price if promo else None
 
-    subscription_price_monthly = promo_price or regular_price
+    subscription_price_monthly = parse_monthly(minimum_price_text)
+    if promo:
+        subscription_price_monthly = promo.promo_price or promo.regular_price
 
     # recalculate min cost from parts if not directly available
     if not min_cost_6_months and price_with_subscription and subscription_price_monthly:
-        if promo_months is not None and regular_price is not None:
-            remaining = max(0, 6 - promo_months)
-            min_cost_6_months = price_with_subscription + promo_months * promo_price + remaining * regular_price
+        if promo:
+            min_cost_6_months = price_with_subscription + promo.cost()
         else:
             min_cost_6_months = price_with_subscription + 6 * subscription_price_monthly
 
@@ -204,54 +187,197 @@ def build_entry(hit, product_type, date_time, use_api_category=False):
     }
 
 
-def scrape_callme():
-    CALLME_DATA_DIR.mkdir(parents=True, exist_ok=True)
-    CALLME_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+def is_valid_search_response(data) -> bool:
+    # the fields build_entry relies on; anything else means the API changed and the browser should take over
+    if not isinstance(data, dict) or not isinstance(data.get("hits"), list):
+        return False
+    return all(isinstance(h, dict) and "productName" in h and "availableColors" in h for h in data["hits"])
 
-    date_time = now_timestamp()
-    all_entries = []
-    seen_names = set()
 
-    is_ci = os.environ.get("CI") == "true"
+def _persisted_headers(headers: dict[str, str]) -> dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() in PERSISTED_HEADERS}
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=is_ci)
-        context = browser.new_context(
-            locale="da-DK",
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-        )
-        context.add_cookies(CONSENT_COOKIES)
-        page = context.new_page()
 
-        for cat_url, (product_type, allowed_categories, use_dynamic_type) in CATEGORY_URLS.items():
-            log(f"\nScraping: {cat_url} (type={product_type})")
+def capture_search_request(request) -> dict:
+    return {
+        "url": request.url,
+        "method": request.method,
+        "headers": _persisted_headers(request.headers),
+        "body": request.post_data,
+    }
+
+
+def load_search_requests() -> dict[str, list[dict]]:
+    if not SEARCH_REQUESTS_FILE.exists():
+        return {}
+    with SEARCH_REQUESTS_FILE.open(encoding="utf-8") as f:
+        search_requests = json.load(f)
+    # files captured before the header whitelist may still hold session headers
+    for templates in search_requests.values():
+        for template in templates:
+            template["headers"] = _persisted_headers(template.get("headers") or {})
+    return search_requests
+
+
+def _with_page(template: dict, page_number: int) -> dict | None:
+    # the same search call for another results page, or None when the call has no recognisable page parameter
+    parts = urlsplit(template["url"])
+    query = dict(parse_qsl(parts.query))
+    for param in PAGE_PARAMS:
+        if param in query:
+            query[param] = str(int(query[param]) + page_number)
+            return template | {"url": urlunsplit(parts._replace(query=urlencode(query)))}
+    try:
+        body = json.loads(template["body"] or "")
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        for param in PAGE_PARAMS:
+            if isinstance(body.get(param), int):
+                return template | {"body": json.dumps(body | {param: body[param] + page_number})}
+    return None
+
+
+def _send(session, template: dict) -> dict:
+    response = session.request(template["method"], template["url"], headers=template["headers"],
+                               data=(template["body"] or "").encode("utf-8") or None, timeout=15)
+    response.raise_for_status()
+    data = response.json()
+    if not is_valid_search_response(data):
+        raise ValueError("unexpected catalog/search response")
+    return data
+
+
+def _hit_key(hit: Any) -> str:
+    if isinstance(hit, dict):
+        for field in HIT_ID_FIELDS:
+            if hit.get(field):
+                return f"{field}:{hit[field]}"
+    return fingerprint(hit)
+
+
+def fetch_hits_direct(session, templates: list[dict]) -> list[dict]:
+    # replay every search call the category page made; for calls with a page parameter keep paging while a page adds
+    # hits not seen before and the reported total (if any) isn't reached, so an endpoint that ignores or clamps the
+    # page parameter costs one extra call rather than MAX_PAGES. raises when a call fails or the schema changed
+    all_hits: list[dict] = []
+    for template in templates:
+        data = _send(session, template)
+        seen: set[str] = set()
+        hits: list[dict] = []
+        total = next((data[f] for f in TOTAL_FIELDS if isinstance(data.get(f), int)), None)
+        for page_number in range(1, MAX_PAGES + 1):
+            new_hits = [hit for hit in data["hits"] if _hit_key(hit) not in seen]
+            seen.update(_hit_key(hit) for hit in new_hits)
+            hits.extend(new_hits)
+            if not new_hits or (total is not None and len(hits) >= total) or page_number == MAX_PAGES:
+                break
+            next_page = _with_page(template, page_number)
+            if next_page is None:
+                break
+            data = _send(session, next_page)
+        all_hits.extend(hits)
+    return all_hits
+
+
+def fetch_hits_browser(page, cat_url: str) -> tuple[list[dict], list[dict]] | None:
+    # render the category page and collect the hits from every catalog/search call it fires, along with the
+    # calls themselves so the next run can make them directly. None if the page didn't load
+    all_hits: list[dict] = []
+    captured: list[dict] = []
+
+    def handle_response(resp):
+        if "catalog/search" in resp.url:
+            try:
+                data = resp.json()
+                all_hits.extend(data.get("hits", []))
+                captured.append(capture_search_request(resp.request))
+            except Exception:
+                pass
+
+    page.on("response", handle_response)
+    try:
+        page.goto(cat_url, wait_until="networkidle", timeout=30000)
+        # networkidle has already let the search calls finish; only wait if none has answered yet
+        wait_until_ready(page, "callme category", 2000, condition=lambda: all_hits)
+    except Exception as e:
+        log(f"  [WARN] Could not load {cat_url}: {e}")
+        return None
+    finally:
+        page.remove_listener("response", handle_response)
+    return all_hits, captured
 
-            # collect all hits from every catalog/search API call fired by this page
-            all_hits = []
 
-            def handle_response(resp):
-                if "catalog/search" in resp.url:
-                    try:
-                        data = resp.json()
-                        all_hits.extend(data.get("hits", []))
-                    except Exception:
-                        pass
+def scrape_callme(browser=None):
+    CALLME_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    CALLME_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
-            page.on("response", handle_response)
+    date_time = now_timestamp()
+    seen_names = set()
+
+    is_ci = os.environ.get("CI") == "true"
 
+    hits_by_category: dict[str, list[dict]] = {}
+    search_requests = load_search_requests()
+
+    # categories a crashed run already fetched are neither called nor rendered again
+    journal = Checkpoint("callme")
+    for cat_url in CATEGORY_URLS:
+        hits = journal.get(cat_url)
+        if hits is not None:
+            hits_by_category[cat_url] = hits
+
+    if CALLME_MODE == "direct":
+        session = http_session()
+        for cat_url in CATEGORY_URLS:
+            templates = search_requests.get(cat_url)
+            if not templates or cat_url in hits_by_category:
+                continue
             try:
-                page.goto(cat_url, wait_until="networkidle", timeout=30000)
-                page.wait_for_timeout(2000)
+                hits_by_category[cat_url] = fetch_hits_direct(session, templates)
+                journal.record(cat_url, hits_by_category[cat_url])
+                log(f"Fetched {cat_url} directly ({len(hits_by_category[cat_url])} hits)")
             except Exception as e:
-                log(f"  [WARN] Could not load {cat_url}: {e}")
-                page.remove_listener("response", handle_response)
+                warn(f"Direct catalog search failed for {cat_url}, falling back to the browser: {e}")
+        session.close()
+
+    # categories the direct calls couldn't serve are rendered, which also captures their search calls for next time
+    missing = [cat_url for cat_url in CATEGORY_URLS if cat_url not in hits_by_category]
+    if missing:
+        with browser_session(browser, headless=is_ci) as browser:
+            context = browser.new_context(
+                locale="da-DK",
+                user_agent=(
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                    "AppleWebKit/537.36 (KHTML, like Gecko) "
+                    "Chrome/120.0.0.0 Safari/537.36"
+                ),
+            )
+            try:
+                context.add_cookies(CONSENT_COOKIES)
+                block_unneeded_requests(context, "callme", allow=("catalog/search",))
+                page = context.new_page()
+
+                for cat_url in missing:
+                    log(f"\nRendering: {cat_url}")
+                    result = fetch_hits_browser(page, cat_url)
+                    if result is None:
+                        continue
+                    hits_by_category[cat_url], captured = result
+                    journal.record(cat_url, hits_by_category[cat_url])
+                    if captured:
+                        search_requests[cat_url] = captured
+            finally:
+                context.close()
+        write_json(SEARCH_REQUESTS_FILE, search_requests, compact=True)
+
+    # offers go to disk as they are built; the file is only replaced once every category is through
+    with json_array_writer(CALLME_OUTPUT_FILE) as out:
+        for cat_url, (product_type, allowed_categories, use_dynamic_type) in CATEGORY_URLS.items():
+            if cat_url not in hits_by_category:
                 continue
-
-            page.remove_listener("response", handle_response)
+            log(f"\nScraping: {cat_url} (type={product_type})")
+            all_hits = hits_by_category[cat_url]
 
             # filter out accessories that are recommended alongside the main products
             hits = [h for h in all_hits if h.get("productCategory") in allowed_categories]
@@ -264,7 +390,7 @@ def scrape_callme():
                 name = entry["product_name"]
                 if name and name not in seen_names and "brugt" not in name.lower():
                     seen_names.add(name)
-                    all_entries.append(entry)
+                    out.append(entry)
                     offer_summary(
                         name,
                         sub=entry["price_with_subscription"],
@@ -274,11 +400,9 @@ def scrape_callme():
                         md=entry["subscription_price_monthly"],
                     )
 
-        browser.close()
-
-    write_json(CALLME_OUTPUT_FILE, all_entries)
+    journal.finish()
 
-    log(f"\nDone. Saved {len(all_entries)} offers to '{CALLME_OUTPUT_FILE}'")
+    log(f"\nDone. Saved {out.count} offers to '{CALLME_OUTPUT_FILE}'")
 
 
 if __name__ == "__main__":
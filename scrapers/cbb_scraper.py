@@ -1,10 +1,13 @@
-import re
 import requests
 import os
 from pathlib import Path
 from typing import TYPE_CHECKING
-from playwright.sync_api import sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary
+from detail_cache import DetailCache, fingerprint
+from page_pool import PagePool
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_monthly, parse_price, parse_promo
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log, offer_summary
 
 if TYPE_CHECKING:
     from playwright._impl._api_structures import SetCookieParam
@@ -14,6 +17,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data" / "cbb"
 IMAGE_DIR = BASE_DIR / "public" / "images" / "cbb"
 OUTPUT_PATH = DATA_DIR / "cbb_offers.json"
+DETAIL_CACHE_PATH = DATA_DIR / "cbb_detail_cache.json"
 
 
 def download_image(image_url, product_name):
@@ -25,34 +29,22 @@ def download_image(image_url, product_name):
         base_url="https://www.cbb.dk",
     )
 
-def parse_price(text):
-    # extract integer price from a string like '1.064 kr.' or '39 kr./md.
-    if not text:
-        return None
-    cleaned = re.sub(r'\D', '', text.replace('.', ''))
-    try:
-        return int(cleaned)
-    except ValueError:
-        return None
-
-
 def get_min_cost_from_page(page, url):
     # minimum 6 month price is more complicated to extract because of the way CBB structures their offers with a mix of upfront price and subscription options
     # returns int or None
     try:
         page.goto(url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(1500)
+        wait_until_ready(page, "cbb detail", 1500, selector="text=/Mindstepris/", dom_stable_ms=300)
 
         # kontant pris / upfront price
         kontant_price = None
 
-        # look for a "Mindstepris inkl. X mdr. abonnement" line - take the LAST number
+        # look for a "Mindstepris inkl. X mdr. abonnement 1.234 kr." line
         mindste_texts = page.locator('text=/Mindstepris/').all_text_contents()
         for raw in mindste_texts:
-            raw = raw.replace('\xa0', ' ')
-            matches = re.findall(r'(\d{1,3}(?:\.\d{3})+|\d{3,})', raw)
-            if matches:
-                return int(matches[-1].replace('.', ''))
+            min_cost = parse_min_cost(raw)
+            if min_cost:
+                return min_cost, None, None
 
         # fallback : "Kontant" price block
         for selector in ['text=Kontant', 'text=Betal kontant', 'text=Betales kontant']:
@@ -93,34 +85,21 @@ def get_min_cost_from_page(page, url):
 
         # --- Monthly subscription price ---
         monthly_price = None
-        promo_price = None
-        promo_months = None
-        regular_price = None
+        promo = None
 
         info_texts = page.locator('text=/kr\\.?\\/md/').all_text_contents()
         for info in info_texts:
-            info = info.replace('\xa0', ' ')
             # Pattern: "39 kr./md. i 2 md. - Herefter 129 kr."
-            m = re.search(
-                r'([\d.]+)\s*kr\.?/md\.?\s+i\s+(\d+)\s+md\.?\s*[-–]\s*[Hh]erefter\s+([\d.]+)\s*kr',
-                info
-            )
-            if m:
-                promo_price = int(m.group(1).replace('.', ''))
-                promo_months = int(m.group(2))
-                regular_price = int(m.group(3).replace('.', ''))
+            promo = parse_promo(info)
+            if promo:
                 break
 
             # Simpler pattern: just "X kr./md."
             if not monthly_price:
-                m2 = re.search(r'([\d.]+)\s*kr\.?/md', info)
-                if m2:
-                    monthly_price = int(m2.group(1).replace('.', ''))
+                monthly_price = parse_monthly(info)
 
-        if kontant_price and promo_price is not None and promo_months is not None and regular_price is not None:
-            remaining_months = max(0, 6 - promo_months)
-            total = kontant_price + (promo_months * promo_price) + (remaining_months * regular_price)
-            return total, promo_price, regular_price
+        if kontant_price and promo:
+            return kontant_price + promo.cost(), promo.promo_price, promo.regular_price
 
         if kontant_price and monthly_price:
             return kontant_price + 6 * monthly_price, monthly_price, None
@@ -131,12 +110,63 @@ def get_min_cost_from_page(page, url):
     return None, None, None
 
 
-def build_entry(phone, page, date_time):
+def _api_strings(value):
+    # every string anywhere in an API entry
+    if isinstance(value, str):
+        yield value.replace('\xa0', ' ')
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _api_strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _api_strings(v)
+
+
+def get_min_cost_from_api(phone):
+    # the same texts the detail page shows, when the load-phones entry already carries them. the upfront price is
+    # the entry's priceInt. returns (min_cost, monthly_price, monthly_price_after_promo), all None if not enough
+    texts = list(_api_strings(phone))
+    for text in texts:
+        min_cost = parse_min_cost(text)
+        if min_cost:
+            return min_cost, None, None
+
+    kontant_price = phone.get("priceInt")
+    if not kontant_price:
+        return None, None, None
+
+    # only the full promo text is trusted here: a bare "X kr./md." in the entry could belong to any subscription
+    for text in texts:
+        promo = parse_promo(text)
+        if promo:
+            return kontant_price + promo.cost(), promo.promo_price, promo.regular_price
+    return None, None, None
+
+
+def product_link_for(phone):
+    url_path = phone.get("url")
+    return f"https://www.cbb.dk{url_path}" if url_path else ""
+
+
+def make_detail_page(browser):
+    context = browser.new_context(
+        locale="da-DK",
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    )
+    # accept cookies up front by injecting consent cookies
+    consent_cookies: list["SetCookieParam"] = [
+        {"name": "CookieInformationConsent", "value": "true", "domain": ".cbb.dk", "path": "/"},
+    ]
+    context.add_cookies(consent_cookies)
+    block_unneeded_requests(context, "cbb")
+    return context, context.new_page()
+
+
+def build_entry(phone, detail, date_time):
     product_name = phone.get("headline", "Ukendt model")
 
     # format product link
-    url_path = phone.get("url")
-    product_link = f"https://www.cbb.dk{url_path}" if url_path else ""
+    product_link = product_link_for(phone)
 
     # get image
     raw_image_url = phone.get("image", {}).get("url")
@@ -148,12 +178,8 @@ def build_entry(phone, page, date_time):
     # check stock status
     sold_out = "true" if phone.get("buttonText", "").upper() == "UDSOLGT" else "false"
 
-    # get accurate min cost by visiting the product page
-    min_cost = None
-    monthly_price = None
-    monthly_price_after_promo = None
-    if product_link:
-        min_cost, monthly_price, monthly_price_after_promo = get_min_cost_from_page(page, product_link)
+    # min cost from the API entry or the product page, see scrape_cbb
+    min_cost, monthly_price, monthly_price_after_promo = detail
 
     return {
         "link": product_link,
@@ -174,7 +200,7 @@ def build_entry(phone, page, date_time):
     }
 
 
-def scrape_cbb():
+def scrape_cbb(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -202,36 +228,61 @@ def scrape_cbb():
 
     is_ci = os.environ.get('CI') == 'true'
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=is_ci)
-        context = browser.new_context(
-            locale="da-DK",
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
-        # accept cookies up front by injecting consent cookies
-        consent_cookies: list["SetCookieParam"] = [
-            {"name": "CookieInformationConsent", "value": "true", "domain": ".cbb.dk", "path": "/"},
-        ]
-        context.add_cookies(consent_cookies)
-        page = context.new_page()
-
-        for phone in phones_list:
-            entry = build_entry(phone, page, date_time)
-            product_name = str(entry.get("product_name", ""))
-            if "brugt" not in product_name.lower():
-                cleaned_results.append(entry)
-                offer_summary(
-                    product_name,
-                    sub=entry["price_with_subscription"],
-                    rabat=entry["discount_on_product"],
-                    kontant=entry["price_without_subscription"],
-                    min6=entry["min_cost_6_months"],
-                    md=entry["subscription_price_monthly"],
-                )
-            else:
-                log(f"  Skipping used product: {product_name}")
-
-        browser.close()
+    # the min cost comes from, in order: the API entry itself, the detail cache (same page, unchanged listing
+    # data), or a visit to the product page
+    cache = DetailCache(DETAIL_CACHE_PATH)
+    details: dict[int, tuple] = {}
+    to_visit: list[tuple[int, str]] = []
+    prints: dict[int, str] = {}
+    from_api = 0
+
+    for i, phone in enumerate(phones_list):
+        product_link = product_link_for(phone)
+        detail = get_min_cost_from_api(phone)
+        if detail[0] is not None:
+            details[i] = detail
+            from_api += 1
+            continue
+        if not product_link:
+            details[i] = (None, None, None)
+            continue
+        prints[i] = fingerprint(phone.get("priceInt"), phone.get("buttonText"), phone.get("headline"))
+        cached = cache.get(product_link, prints[i])
+        if cached is not None:
+            details[i] = tuple(cached)
+        else:
+            to_visit.append((i, product_link))
+
+    log(f"Min cost from API: {from_api}, from cache: {cache.hits}, product pages to visit: {len(to_visit)}")
+
+    if to_visit:
+        with browser_session(browser, headless=is_ci) as browser:
+            pool = PagePool(browser, make_detail_page, name="cbb", domain="cbb.dk", headless=is_ci)
+            visited = pool.map([product_link for _, product_link in to_visit], get_min_cost_from_page)
+        for (i, product_link), detail in zip(to_visit, visited):
+            detail = detail or (None, None, None)
+            details[i] = detail
+            if detail[0] is not None:
+                cache.put(product_link, prints[i], list(detail))
+
+    cache.prune({product_link_for(phone) for phone in phones_list})
+    cache.save()
+
+    for i, phone in enumerate(phones_list):
+        entry = build_entry(phone, details[i], date_time)
+        product_name = str(entry.get("product_name", ""))
+        if "brugt" not in product_name.lower():
+            cleaned_results.append(entry)
+            offer_summary(
+                product_name,
+                sub=entry["price_with_subscription"],
+                rabat=entry["discount_on_product"],
+                kontant=entry["price_without_subscription"],
+                min6=entry["min_cost_6_months"],
+                md=entry["subscription_price_monthly"],
+            )
+        else:
+            log(f"  Skipping used product: {product_name}")
 
     # save output
     write_json(OUTPUT_PATH, cleaned_results)
@@ -240,4 +291,4 @@ def scrape_cbb():
 
 
 if __name__ == "__main__":
-    scrape_cbb()
\ No newline at end of file
+    scrape_cbb()
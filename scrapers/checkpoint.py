@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, TextIO
+from scraper_utils import BASE_DIR, log, warn
+
+# append-only journal of the work a long scraper run has finished, one JSON line per product as it completes. a run
+# that dies leaves its journal behind and the next run picks up where it stopped instead of loading every page again;
+# a run that gets all the way to writing its output deletes it
+
+CHECKPOINT_DIR = Path(os.environ.get("CHECKPOINT_DIR", BASE_DIR / "data" / "checkpoints"))
+# an older journal is left over from an earlier day's run, not a crash worth resuming
+CHECKPOINT_MAX_AGE_HOURS = float(os.environ.get("CHECKPOINT_MAX_AGE_HOURS", "12"))
+
+
+class Checkpoint:
+
+    def __init__(self, name: str, *, max_age_hours: float = CHECKPOINT_MAX_AGE_HOURS):
+        self.path = CHECKPOINT_DIR / f"{name}.jsonl"
+        self.entries: dict[str, Any] = {}
+        # lookup shards record from several threads
+        self._lock = threading.Lock()
+        self._file: TextIO | None = None
+        self._torn = False
+        if not self.path.exists():
+            return
+        if time.time() - self.path.stat().st_mtime > max_age_hours * 3600:
+            log(f"Discarding stale checkpoint {self.path.name}")
+            self.path.unlink()
+            return
+        text = self.path.read_text(encoding="utf-8")
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+                self.entries[record["key"]] = record["value"]
+            except (ValueError, KeyError, TypeError):
+                # the line being written when the run died
+                continue
+        # start the next record on a line of its own after a half-written one
+        self._torn = bool(text) and not text.endswith("\n")
+        log(f"Resuming from checkpoint {self.path.name}: {len(self.entries)} done")
+
+    def get(self, key: str) -> Any | None:
+        return self.entries.get(key)
+
+    def record(self, key: str, value: Any) -> None:
+        # on disk before this returns, so a crash right after loses nothing
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.entries[key] = value
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a", encoding="utf-8")
+                if self._torn:
+                    self._file.write("\n")
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def finish(self) -> None:
+        # call once the output built from the journal is written
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                self.path.unlink(missing_ok=True)
+            except OSError as e:
+                warn(f"Could not remove checkpoint {self.path}: {e}")
@@ -0,0 +1,73 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+from scraper_utils import now_timestamp, write_json
+
+# results scraped from product detail pages, kept between runs. an entry is keyed by the page URL and is only reused
+# while the fingerprint of the listing data it was scraped for (price, stock text, ...) is unchanged and it is younger
+# than the maximum age — detail-only fields can change without the listing showing it, so nothing is reused forever
+
+TIMESTAMP_FORMAT = "%d-%m-%Y-%H:%M"  # same format as now_timestamp()
+DETAIL_CACHE_MAX_AGE_DAYS = float(os.environ.get("DETAIL_CACHE_MAX_AGE_DAYS", "3"))
+
+
+def fingerprint(*parts: Any) -> str:
+    # stable short hash of any JSON-serialisable listing data
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DetailCache:
+
+    def __init__(self, path: Path, *, max_age_days: float = DETAIL_CACHE_MAX_AGE_DAYS, expiry_spread: float = 0.0):
+        self.path = path
+        self.max_age = datetime.timedelta(days=max_age_days)
+        # entries scraped on the same run expire anywhere between (1 - expiry_spread) * max_age and max_age, at a point
+        # fixed per URL, so re-scraping them is spread over several runs instead of all landing on one
+        self.expiry_spread = expiry_spread
+        self.now = datetime.datetime.now()
+        self.entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        # detail pages are scraped from several threads at once
+        self._lock = threading.Lock()
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, url: str, fingerprint: str) -> Any | None:
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is None or entry.get("fingerprint") != fingerprint or not self._is_fresh(url, entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["result"]
+
+    def _is_fresh(self, url: str, entry: dict) -> bool:
+        try:
+            scraped_at = datetime.datetime.strptime(entry["scraped_at"], TIMESTAMP_FORMAT)
+        except (KeyError, ValueError):
+            return False
+        max_age = self.max_age
+        if self.expiry_spread:
+            position = int(fingerprint(url), 16) / 16 ** 16
+            max_age *= 1 - self.expiry_spread * position
+        return self.now - scraped_at < max_age
+
+    def put(self, url: str, fingerprint: str, result: Any) -> None:
+        with self._lock:
+            self.entries[url] = {"fingerprint": fingerprint, "result": result, "scraped_at": now_timestamp()}
+
+    def prune(self, keep: set[str]) -> None:
+        # drop pages that are no longer listed so the file doesn't grow forever
+        with self._lock:
+            self.entries = {url: entry for url, entry in self.entries.items() if url in keep}
+
+    def save(self) -> None:
+        with self._lock:
+            write_json(self.path, self.entries, compact=True)
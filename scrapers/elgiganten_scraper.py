@@ -1,8 +1,10 @@
 import time
+import os
 import re
-from playwright.sync_api import ViewportSize, sync_playwright
+from playwright.sync_api import ViewportSize
 from pathlib import Path
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log, offer_summary
 
 # setup
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -10,6 +12,54 @@ IMAGE_DIR = BASE_DIR / "public" / "images" / "elgiganten"
 OUTPUT_PATH = BASE_DIR / "data" / "elgiganten" / "elgiganten_offers.json"
 VIEWPORT: ViewportSize = {"width": 1920, "height": 10000}
 
+# price and subscription requests in flight at once while a listing page's batch is fetched
+API_CONCURRENCY = int(os.environ.get("ELGIGANTEN_API_CONCURRENCY", "4"))
+
+# everything the scraper needs from the product cards on a listing page, read in one round trip
+READ_CARDS_JS = """() => [...document.querySelectorAll('a[data-testid="product-card"]')].map(card => {
+    const html = card.innerHTML;
+    const name = card.querySelector('h2');
+    const image = card.querySelector('.product-card-image img');
+    return {
+        sku: card.getAttribute('data-item-id'),
+        href: card.getAttribute('href'),
+        name: name ? name.innerText.trim() : null,
+        image: image ? image.getAttribute('src') : null,
+        subsidised: html.includes('Mindstepris') || html.toLowerCase().includes('mobilrabat'),
+    };
+})"""
+
+# the price and subscription lookups for a batch of SKUs, `limit` SKUs at a time, keyed by SKU. a failed request
+# gives null, the same as a non-ok response did when the lookups were made one by one
+FETCH_OFFERS_JS = """async ({ skus, limit }) => {
+    const getJson = async (url, init) => {
+        try {
+            const res = await fetch(url, init);
+            return res.ok ? await res.json() : null;
+        } catch (e) {
+            return null;
+        }
+    };
+    const results = {};
+    let next = 0;
+    const worker = async () => {
+        while (next < skus.length) {
+            const sku = skus[next++];
+            const [price, subscriptions] = await Promise.all([
+                getJson(`/api/price/${sku}`),
+                getJson('/api/subscriptions', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'text/plain;charset=UTF-8' },
+                    body: JSON.stringify({ type: 'Telecom', sku: String(sku), step: 'identification' }),
+                }),
+            ]);
+            results[sku] = { price, subscriptions };
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(limit, skus.length) }, worker));
+    return results;
+}"""
+
 
 def clean_product_name(product_name):
     # stop at storage size bc we don't need to save color
@@ -57,7 +107,7 @@ def build_entry(product_link, product_name, local_image_path, raw_data, price_da
     }
 
 
-def scrape_elgiganten():
+def scrape_elgiganten(browser=None):
     (BASE_DIR / 'data' / 'elgiganten').mkdir(parents=True, exist_ok=True)
     (BASE_DIR / 'public' / 'images' / 'elgiganten').mkdir(parents=True, exist_ok=True)
 
@@ -66,76 +116,68 @@ def scrape_elgiganten():
     seen_products = set()
     max_pages = 3
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
+    with browser_session(browser) as browser:
         context = browser.new_context(
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
             viewport=VIEWPORT
         )
 
-        browser_page = context.new_page()
-
-        for category in CATEGORY_URLS:
-            base_url = category["base_url"]
-            product_type = category["type"]
-            log(f"\nScraping category: {base_url} (type: {product_type})")
-
-            for page_num in range(1, max_pages + 1):
-                if page_num == 1:
-                    url = base_url
-                else:
-                    url = f"{base_url}/page-{page_num}"
-
-                log(f"scanning page {page_num}: {url}")
-
-                try:
-                    browser_page.goto(url, wait_until="networkidle")
-                    browser_page.wait_for_selector('a[data-testid="product-card"]', timeout=10000)
-                except Exception as e:
-                    log(f"Couldn't load page {page_num} or found no products: {e}")
-                    continue
-
-                product_cards = browser_page.query_selector_all('a[data-testid="product-card"]')
-                log(f"Found {len(product_cards)} products on page {page_num}")
-
-                for card in product_cards:
-                    card_html = card.inner_html()
+        try:
+            # images stay: the card images lazy-load into view (hence the tall viewport) and READ_CARDS_JS reads their src
+            block_unneeded_requests(context, "elgiganten", blocked_types=frozenset({"media", "font"}))
+            browser_page = context.new_page()
+
+            for category in CATEGORY_URLS:
+                base_url = category["base_url"]
+                product_type = category["type"]
+                log(f"\nScraping category: {base_url} (type: {product_type})")
+
+                for page_num in range(1, max_pages + 1):
+                    if page_num == 1:
+                        url = base_url
+                    else:
+                        url = f"{base_url}/page-{page_num}"
+
+                    log(f"scanning page {page_num}: {url}")
+
+                    try:
+                        browser_page.goto(url, wait_until="networkidle")
+                        browser_page.wait_for_selector('a[data-testid="product-card"]', timeout=10000)
+                    except Exception as e:
+                        log(f"Couldn't load page {page_num} or found no products: {e}")
+                        continue
+
+                    cards = browser_page.evaluate(READ_CARDS_JS)
+                    log(f"Found {len(cards)} products on page {page_num}")
+
+                    # subsidised cards not seen on an earlier page, then every lookup for them in one batch
+                    batch = []
+                    for card in cards:
+                        if not card["subsidised"]:
+                            continue
+                        clean_name = clean_product_name(card["name"] or "Ukendt model")  # strip color
+                        if clean_name in seen_products:
+                            continue
+                        seen_products.add(clean_name)
+                        batch.append((card, clean_name))
 
-                    if "Mindstepris" in card_html or "mobilrabat" in card_html.lower():
-                        sku = card.get_attribute('data-item-id')
+                    offers = browser_page.evaluate(FETCH_OFFERS_JS, {
+                        "skus": [card["sku"] for card, _ in batch],
+                        "limit": API_CONCURRENCY,
+                    }) if batch else {}
 
+                    for card, clean_name in batch:
                         # product link
-                        href = card.get_attribute('href')
+                        href = card["href"]
                         product_link = f"https://www.elgiganten.dk{href}" if href and href.startswith('/') else href or ""
 
-                        name_el = card.query_selector('h2')
-                        product_name = name_el.inner_text().strip() if name_el else "Ukendt model"
-                        clean_name = clean_product_name(product_name)  # strip color
-
-                        if clean_name in seen_products:
-                            continue
-                        seen_products.add(clean_name)
-
-                        price_data = browser_page.evaluate(f"""async () => {{
-                            const res = await fetch('/api/price/{sku}');
-                            return res.ok ? res.json() : null;
-                        }}""")
-
-                        api_payload = {"type": "Telecom", "sku": str(sku), "step": "identification"}
-                        raw_data = browser_page.evaluate("""async (payload) => {
-                            const res = await fetch('/api/subscriptions', {
-                                method: 'POST',
-                                headers: { 'Content-Type': 'text/plain;charset=UTF-8' },
-                                body: JSON.stringify(payload)
-                            });
-                            return res.ok ? res.json() : null;
-                        }""", api_payload)
+                        offer = offers.get(str(card["sku"])) or {}
+                        price_data = offer.get("price")
+                        raw_data = offer.get("subscriptions")
 
                         if raw_data and 'data' in raw_data:
-                            # get image url and download it
-                            image_el = card.query_selector('.product-card-image img')
-                            raw_image_url = image_el.get_attribute('src') if image_el else None
-                            local_image_path = download_image(raw_image_url, clean_name)
+                            # download the card's image
+                            local_image_path = download_image(card["image"], clean_name)
 
                             entry = build_entry(product_link, clean_name, local_image_path, raw_data, price_data, date_time, product_type)
                             cleaned_results.append(entry)
@@ -148,9 +190,9 @@ def scrape_elgiganten():
                                 md=entry["subscription_price_monthly"],
                             )
 
-                        time.sleep(0.5)
-
-                time.sleep(2)
+                    time.sleep(2)
+        finally:
+            context.close()
 
     write_json(OUTPUT_PATH, cleaned_results)
 
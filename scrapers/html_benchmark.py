@@ -0,0 +1,66 @@
+import argparse
+import time
+from pathlib import Path
+from html_parsing import HTML_PARSERS, HTML_SNAPSHOT_DIR, parse_html
+
+# offline parse benchmark over saved pages — no browser, no network.
+#
+# snapshots are recorded by running scrapers with HTML_SNAPSHOT_DIR set; every page parsed with a label is saved
+# there as <label>.html. each parser builds a tree for every snapshot and the tag counts are compared, so a parser
+# that repairs the markup differently shows up next to its timing
+#
+#   HTML_SNAPSHOT_DIR=/tmp/pages python -m scrapers run telmore telmore_tilgift oister
+#   python scrapers/html_benchmark.py --snapshots /tmp/pages
+
+
+def _best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def benchmark(pages: dict[str, str], parser: str, repeat: int) -> tuple[float, dict[str, int]]:
+    # (best seconds to parse every page, tag count per page)
+    tags = {name: len(parse_html(html, parser=parser).find_all(True)) for name, html in pages.items()}
+
+    def parse_all():
+        for html in pages.values():
+            parse_html(html, parser=parser)
+
+    return _best_of(repeat, parse_all), tags
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline parse benchmark for the HTML parser backends.")
+    parser.add_argument("--snapshots", type=Path, default=HTML_SNAPSHOT_DIR,
+                        help="directory of saved .html pages (default: HTML_SNAPSHOT_DIR)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions, best one is reported")
+    args = parser.parse_args(argv)
+
+    if not args.snapshots:
+        parser.error("no snapshot directory: pass --snapshots or set HTML_SNAPSHOT_DIR")
+    pages = {path.name: path.read_text(encoding="utf-8") for path in sorted(Path(args.snapshots).glob("*.html"))}
+    if not pages:
+        parser.error(f"no .html files in {args.snapshots}")
+
+    size = sum(len(html) for html in pages.values())
+    print(f"pages: {len(pages)}  ({size / 1_000_000:.1f} MB of HTML)")
+
+    results = {name: benchmark(pages, name, args.repeat) for name in HTML_PARSERS}
+    baseline = results["html.parser"][0]
+    for name, (seconds, _) in results.items():
+        print(f"{name:<12} {seconds * 1000 / len(pages):8.1f} ms/page  {baseline / seconds:5.1f}x")
+
+    reference = results["html.parser"][1]
+    for name, (_, tags) in results.items():
+        differing = [page for page, count in tags.items() if count != reference[page]]
+        if differing:
+            print(f"{name}: tag count differs from html.parser on {len(differing)} page(s): {', '.join(differing)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,23 @@
+import os
+import re
+from pathlib import Path
+from bs4 import BeautifulSoup
+
+# tree builder behind every BeautifulSoup the scrapers make. lxml builds the same tree several times faster than the
+# pure-Python "html.parser"; the latter stays selectable in case lxml repairs some broken markup differently
+HTML_PARSERS = ("lxml", "html.parser")
+HTML_PARSER = os.environ.get("HTML_PARSER", "lxml")
+
+# set to a directory to keep a copy of every page parsed with a label, for html_benchmark.py or for debugging a
+# selector offline
+HTML_SNAPSHOT_DIR = os.environ.get("HTML_SNAPSHOT_DIR")
+
+
+def parse_html(html: str, label: str | None = None, *, parser: str | None = None) -> BeautifulSoup:
+    # parse a whole page once; callers query the returned tree as often as they like
+    if HTML_SNAPSHOT_DIR and label:
+        snapshot_dir = Path(HTML_SNAPSHOT_DIR)
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^a-z0-9]+", "_", label.lower()).strip("_")
+        (snapshot_dir / f"{name}.html").write_text(html, encoding="utf-8")
+    return BeautifulSoup(html, parser or HTML_PARSER)
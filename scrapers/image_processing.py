@@ -0,0 +1,76 @@
+import dataclasses
+import io
+import os
+import threading
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+# product images are shown as thumbnails, so anything larger than this box is wasted bytes on every page view
+IMAGE_MAX_SIZE = int(os.environ.get("IMAGE_MAX_SIZE", "600"))
+IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))
+
+
+@dataclasses.dataclass
+class ImageStats:
+    count: int = 0
+    original_bytes: int = 0
+    final_bytes: int = 0
+
+
+# totals for the whole process, reported by the orchestrator's run summary
+stats = ImageStats()
+_stats_lock = threading.Lock()
+
+
+def _record(original: int, final: int) -> None:
+    with _stats_lock:
+        stats.count += 1
+        stats.original_bytes += original
+        stats.final_bytes += final
+
+
+def to_webp(content: bytes, *, max_size: int = IMAGE_MAX_SIZE, quality: int = IMAGE_WEBP_QUALITY) -> bytes:
+    # decode whatever the shop served, shrink it into a max_size box and encode it as real WebP. a WebP that
+    # already fits is kept as is rather than re-encoded with another round of loss. raises if it isn't an image
+    with Image.open(io.BytesIO(content)) as image:
+        fits = image.width <= max_size and image.height <= max_size
+        if image.format == "WEBP" and fits:
+            _record(len(content), len(content))
+            return content
+
+        image = ImageOps.exif_transpose(image)
+        if not fits:
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=quality)
+
+    webp = out.getvalue()
+    _record(len(content), len(webp))
+    return webp
+
+
+def convert_store(root: Path, *, skip: Path | None = None, dry_run: bool = False) -> ImageStats:
+    # one-off pass over images saved before downloads were transcoded: every file is re-encoded in place (under
+    # its existing name, so no offer JSON changes). files that fail to decode are left alone, and so is everything
+    # under `skip` — the content-addressed store, whose files were transcoded before being named after their hash
+    result = ImageStats()
+    for path in sorted(root.rglob("*.webp")):
+        if skip is not None and path.is_relative_to(skip):
+            continue
+        original = path.read_bytes()
+        try:
+            converted = to_webp(original)
+        except Exception:
+            continue
+        result.count += 1
+        result.original_bytes += len(original)
+        result.final_bytes += len(converted)
+        if not dry_run and converted != original:
+            partial_path = path.with_name(path.name + ".part")
+            partial_path.write_bytes(converted)
+            partial_path.replace(path)
+    return result
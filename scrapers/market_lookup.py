@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from contextlib import ExitStack
+from typing import Callable, Iterable
+from checkpoint import Checkpoint
+from market_price_cache import MarketPriceCache
+from scraper_utils import browser_session, domain_slot, log, log_scope, error, now_timestamp
+
+# number of independent browser contexts working through the product list at once
+MARKET_PRICE_SHARDS = int(os.environ.get("MARKET_PRICE_SHARDS", "1"))
+# politeness cap: never more than this many searches in flight against one site, whatever the shard count
+MAX_CONCURRENT_PER_DOMAIN = int(os.environ.get("MARKET_PRICE_MAX_PER_DOMAIN", "2"))
+
+FAILURE_THRESHOLD = 3
+
+class _WorkQueue:
+    # hands out products one at a time to whichever shard asks next; works for lists and streaming feeds alike
+
+    def __init__(self, products: Iterable[str]):
+        self._products = iter(products)
+        self._lock = threading.Lock()
+
+    def next(self) -> str | None:
+        with self._lock:
+            return next(self._products, None)
+
+
+class _LookupStats:
+    def __init__(self) -> None:
+        self.looked_up = 0
+        self.from_cache = 0
+        self._lock = threading.Lock()
+
+    def count(self, looked_up: bool) -> None:
+        with self._lock:
+            if looked_up:
+                self.looked_up += 1
+            else:
+                self.from_cache += 1
+
+
+def run_lookups(
+    products: Iterable[str],
+    *,
+    browser,
+    domain: str,
+    cache: MarketPriceCache,
+    make_fresh_page: Callable,
+    get_market_price: Callable,
+    clean_search_query: Callable[[str], str],
+    shards: int = MARKET_PRICE_SHARDS,
+    headless: bool = True,
+    checkpoint: Checkpoint | None = None,
+) -> tuple[dict, int, int]:
+    # look up every product across `shards` independent browser contexts, each built by the site's
+    # make_fresh_page and each with its own failure counter and context recycling. shard 0 runs in the calling
+    # thread on the browser it was given; the others run in threads with their own browser, since the sync
+    # Playwright API can't be shared across threads. every lookup whose page loaded is recorded in `checkpoint`, and
+    # products it already holds are taken from it without a search. returns (results, looked_up, served_from_cache)
+    work = _WorkQueue(products)
+    results: dict[str, dict] = {}
+    stats = _LookupStats()
+    slot = domain_slot(domain, MAX_CONCURRENT_PER_DOMAIN)
+
+    def lookup(page, product_name):
+        with slot:
+            return get_market_price(page, product_name)
+
+    def run_shard(shard_browser) -> None:
+        # opened on the first cache miss, so a fully cached run never loads a page
+        context = page = None
+        consecutive_failures = 0
+        try:
+            while (product_name := work.next()) is not None:
+                query = clean_search_query(product_name)
+
+                done = checkpoint.get(product_name) if checkpoint else None
+                if done is not None:
+                    if done["cache"]:
+                        cache.restore(query, done["cache"])
+                    results[product_name] = done["result"]
+                    log(f"Resumed: {product_name} -> {done['result']['market_price']} kr.")
+                    continue
+
+                if not cache.needs_lookup(query):
+                    cached = cache.get(query)
+                    results[product_name] = {
+                        "market_price": cached["market_price"],
+                        "looked_up_at": cached["looked_up_at"]
+                    }
+                    log(f"Cached: {product_name} -> {cached['market_price']} kr.")
+                    stats.count(looked_up=False)
+                    continue
+
+                if page is None:
+                    context, page = make_fresh_page(shard_browser)
+
+                log(f"Looking up: {product_name}")
+                price, page_loaded, matched_title, score = lookup(page, product_name)
+
+                if not page_loaded:
+                    consecutive_failures += 1
+                    log(f"  [failure {consecutive_failures}/{FAILURE_THRESHOLD}]")
+
+                    if consecutive_failures >= FAILURE_THRESHOLD:
+                        # recycle the browser context to recover from a potential block
+                        log(f"\n  !! {FAILURE_THRESHOLD} consecutive failures — recycling browser context and pausing 10s...\n")
+                        context.close()
+                        time.sleep(10)
+                        context, page = make_fresh_page(shard_browser)
+                        consecutive_failures = 0
+
+                        log(f"  Retrying: {product_name}")
+                        price, page_loaded, matched_title, score = lookup(page, product_name)
+                else:
+                    consecutive_failures = 0
+
+                # a page that never loaded says nothing about the price, so keep whatever the cache already had
+                if page_loaded:
+                    cache.put(query, price, matched_title, score)
+                    stats.count(looked_up=True)
+                entry = cache.get(query) or {"market_price": None, "looked_up_at": now_timestamp()}
+
+                results[product_name] = {
+                    "market_price": entry["market_price"],
+                    "looked_up_at": entry["looked_up_at"]
+                }
+                # a lookup whose page never loaded (blocked, timed out) is left for a resumed run to try again
+                if checkpoint and page_loaded:
+                    checkpoint.record(product_name, {"result": results[product_name], "cache": cache.get(query)})
+                log(f"  -> {entry['market_price']} kr.")
+        finally:
+            if context is not None:
+                context.close()
+
+    def run_extra_shard(index: int) -> None:
+        with log_scope(f"{domain} #{index}"), ExitStack() as stack:
+            try:
+                run_shard(stack.enter_context(browser_session(headless=headless)))
+            except Exception as e:
+                # the remaining shards keep draining the queue
+                error(f"Lookup shard {index} stopped: {e}")
+
+    threads = [threading.Thread(target=run_extra_shard, args=(i,), name=f"{domain}-shard-{i}") for i in range(1, shards)]
+    for thread in threads:
+        thread.start()
+    try:
+        run_shard(browser)
+    finally:
+        for thread in threads:
+            thread.join()
+
+    return results, stats.looked_up, stats.from_cache
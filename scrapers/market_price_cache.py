@@ -0,0 +1,106 @@
+import datetime
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+from scraper_utils import now_timestamp, write_json
+
+TIMESTAMP_FORMAT = "%d-%m-%Y-%H:%M"  # same format as now_timestamp()
+
+# how long a looked-up market price is trusted before it is searched again
+CACHE_TTL_DAYS = float(os.environ.get("MARKET_PRICE_TTL_DAYS", "7"))
+# how many stale entries may be re-searched per run; products that were never looked up don't count
+MAX_REFRESH_PER_RUN = int(os.environ.get("MARKET_PRICE_MAX_REFRESH", "60"))
+
+
+class MarketPriceCache:
+    # persistent market-price lookups keyed by the cleaned search query. each entry holds the price, the
+    # matched listing title, its match score and when it was looked up
+
+    def __init__(self, path: Path, *, ttl_days: float = CACHE_TTL_DAYS, max_refresh: int = MAX_REFRESH_PER_RUN):
+        self.path = path
+        self.ttl = datetime.timedelta(days=ttl_days)
+        self.refresh_budget = max_refresh
+        self.now = datetime.datetime.now()
+        self.entries: dict[str, dict] = {}
+        # lookup shards share one cache
+        self._lock = threading.Lock()
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, query: str) -> dict | None:
+        return self.entries.get(query)
+
+    def age(self, query: str) -> datetime.timedelta | None:
+        entry = self.entries.get(query)
+        if not entry:
+            return None
+        try:
+            looked_up_at = datetime.datetime.strptime(entry["looked_up_at"], TIMESTAMP_FORMAT)
+        except (KeyError, ValueError):
+            return None
+        return self.now - looked_up_at
+
+    def is_fresh(self, query: str) -> bool:
+        age = self.age(query)
+        return age is not None and age < self.ttl
+
+    def prioritize(self, products: Iterable[str], query_for: Callable[[str], str]) -> list[str]:
+        # never-looked-up products first, then stale entries oldest first, then fresh ones (served from cache)
+        def sort_key(product_name):
+            age = self.age(query_for(product_name))
+            if age is None:
+                return 0, 0.0
+            if age >= self.ttl:
+                return 1, -age.total_seconds()
+            return 2, 0.0
+
+        return sorted(products, key=sort_key)
+
+    def prioritize_stream(self, products: Iterable[str], query_for: Callable[[str], str]) -> Iterator[str]:
+        # prioritize for a feed that is still arriving: never-looked-up and fresh products pass straight through,
+        # stale ones are held until the feed ends and then come oldest first, so the refresh budget still goes to
+        # the oldest prices
+        stale: list[tuple[datetime.timedelta, str]] = []
+        for product_name in products:
+            age = self.age(query_for(product_name))
+            if age is not None and age >= self.ttl:
+                stale.append((age, product_name))
+            else:
+                yield product_name
+        stale.sort(key=lambda item: item[0], reverse=True)
+        yield from (product_name for _, product_name in stale)
+
+    def needs_lookup(self, query: str) -> bool:
+        # missing entries are always looked up; stale ones only while the refresh budget lasts
+        if self.age(query) is None:
+            return True
+        if self.is_fresh(query):
+            return False
+        with self._lock:
+            if self.refresh_budget > 0:
+                self.refresh_budget -= 1
+                return True
+        return False
+
+    def put(self, query: str, price: int | None, matched_title: str | None, score: float | None) -> dict:
+        entry = {
+            "market_price": price,
+            "matched_title": matched_title,
+            "score": round(score, 3) if score is not None else None,
+            "looked_up_at": now_timestamp(),
+        }
+        with self._lock:
+            self.entries[query] = entry
+        return entry
+
+    def restore(self, query: str, entry: dict) -> None:
+        # an entry put by a run that died before saving, see checkpoint.py
+        with self._lock:
+            self.entries[query] = entry
+
+    def save(self) -> None:
+        with self._lock:
+            write_json(self.path, self.entries, compact=True)
@@ -0,0 +1,130 @@
+import re
+from difflib import SequenceMatcher
+from typing import Callable
+
+# frozen copies of the scorers PriceRunner and Prisjagt each shipped before product_matching.py replaced them.
+# match_benchmark.py holds the shared engine to these: a case either of them got right must stay right. don't
+# "fix" anything in here — a change to the reference hides the regressions it exists to catch
+
+_TIER_WORDS = {'ultra', 'aktiv støjreduktion', 'anc', 'plus', 'pro', 'max', 'mini', 'fe', 'fold', 'flip', 'lite',
+               'edge', 'air'}
+
+_ACCESSORY_KEYWORDS = {
+    'case', 'cover', 'etui', 'skærmbeskyttelse', 'screen protector', 'beskyttelsesglas',
+    'oplader', 'charger', 'kabel', 'cable', 'rem', 'strap', 'sleeve',
+    'folie', 'glass', 'bumper', 'wallet', 'pung', 'holder', 'stand', 'dock',
+    'batteri', 'battery', 'ear', 'stylus', 'pen',
+    'loop', 'band', 'trail loop', 'alpine loop', 'milanese', 'sport loop',
+}
+
+_NOISE = {'samsung', 'apple', 'google', 'motorola', 'oneplus', 'nothing', 'urbanista',
+          'galaxy', 'iphone', 'pixel', 'moto', 'nord', 'razr', 'leva',
+          '5g', '4g', 'lte', 'dual', 'sim', 'sm', 'smartphone', 'wireless',
+          'black', 'white', 'blue', 'green', 'grey', 'gray', 'silver', 'gold',
+          'sort', 'grå', 'hvid', 'obsidian', 'coral', 'red', 'jetblack',
+          'dark', 'true', 'on', 'ear', 'tws', 'gen'}
+
+_PRICERUNNER_TIER_WORDS = _TIER_WORDS | {'cellular'}
+_PRICERUNNER_NOISE = _NOISE | {'space black', 'wifi',
+                               # tablet screen sizes — not model numbers
+                               '10', '11', '12', '13', '14', '15', '16', '17', '18', '20', '24', '27'}
+_PRISJAGT_NOISE = _NOISE | {'silver shadow', 'space', 'cosmic', 'ocean', 'starlight', 'midnight', 'sunrise',
+                            'space grey', 'grisaille', 'charcoal grey', 'navy', 'silhouette', 'moonstone',
+                            'graphite', 'obsidian', 'blueblack'}
+
+
+def _normalize(text):
+    text = text.lower()
+    text = re.sub(r'\+', ' plus ', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def _extract_storage(text):
+    cleaned = re.sub(r'\d+\s*GB\s*RAM', '', text, flags=re.IGNORECASE)
+    m = re.search(r'(\d+)\s*TB', cleaned, re.IGNORECASE)
+    if m:
+        return int(m.group(1)) * 1024
+    m = re.search(r'(\d+)\s*GB', cleaned, re.IGNORECASE)
+    if m:
+        return int(m.group(1))
+    return None
+
+
+def _split_fused_tokens(text):
+    tokens = set()
+    for word in _normalize(text).split():
+        tokens.update(re.findall(r'[a-z]+|\d+', word))
+        tokens.add(word)
+    return tokens
+
+
+def _extract_model_number(text, noise):
+    text = re.sub(r'\d+\s*GB\s*RAM', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\d+\s*(GB|TB)', '', text, flags=re.IGNORECASE)
+    for token in _normalize(text).split():
+        if token in noise:
+            continue
+        if re.search(r'\d', token):
+            return token
+    return None
+
+
+def _non_storage_digits(text, storage, model):
+    storage_str = str(storage) if storage else None
+    model_digits = set(re.findall(r'\d+', model)) if model else set()
+    return {tok for tok in _normalize(text).split()
+            if tok.isdigit() and tok != storage_str and tok not in model_digits}
+
+
+def _scorer(tier_words: set[str], noise: set[str], extra_digits: bool) -> Callable[[str, str], float]:
+    noise = noise | tier_words
+
+    def score_match(query, candidate):
+        candidate_lower = candidate.lower()
+        if any(kw in candidate_lower for kw in _ACCESSORY_KEYWORDS):
+            return 0.0
+
+        q_tokens = _split_fused_tokens(query)
+        c_tokens = _split_fused_tokens(candidate)
+        for word in tier_words:
+            if (word in c_tokens) != (word in q_tokens):
+                return 0.0
+
+        q_storage = _extract_storage(query)
+        c_storage = _extract_storage(candidate)
+        if q_storage is not None and c_storage is not None and q_storage != c_storage:
+            return 0.0
+
+        q_model = _extract_model_number(query, noise)
+        c_model = _extract_model_number(candidate, noise)
+        if q_model and c_model and q_model != c_model:
+            q_parts = set(re.findall(r'[a-z]+|\d+', q_model))
+            c_parts = set(re.findall(r'[a-z]+|\d+', c_model))
+            q_digits = {p for p in q_parts if p.isdigit()}
+            c_digits = {p for p in c_parts if p.isdigit()}
+            q_alpha = q_parts - q_digits
+            c_alpha = c_parts - c_digits
+            if q_digits != c_digits:
+                return 0.0
+            if q_alpha != c_alpha:
+                if q_alpha and c_alpha:
+                    return 0.0
+                if not (q_alpha or c_alpha).issubset(tier_words):
+                    return 0.0
+
+        # PriceRunner only
+        if extra_digits and (_non_storage_digits(candidate, c_storage, c_model)
+                             - _non_storage_digits(query, q_storage, q_model)):
+            return 0.0
+
+        return SequenceMatcher(None, _normalize(query), _normalize(candidate)).ratio()
+
+    return score_match
+
+
+BASELINE_SCORERS: dict[str, Callable[[str, str], float]] = {
+    "pricerunner": _scorer(_PRICERUNNER_TIER_WORDS, _PRICERUNNER_NOISE, extra_digits=True),
+    "prisjagt": _scorer(_TIER_WORDS, _PRISJAGT_NOISE, extra_digits=False),
+}
@@ -0,0 +1,260 @@
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+import product_matching
+from match_baseline import BASELINE_SCORERS
+from product_matching import MATCH_THRESHOLD, SIMILARITY_BACKENDS, normalize, rank_candidates, score_match, set_similarity_backend
+from provider_sources import PROVIDER_SOURCES, read_product_names
+
+# offline benchmark and regression corpus for product matching — no browser, no network.
+#
+# a corpus is JSONL, one case per line: {"query": ..., "candidates": [titles...], "expected": [titles...]}
+# where "expected" lists every acceptable pick (empty = nothing should match). cases come from two places:
+#   - captured: run the market-price scrapers with MATCH_CORPUS_PATH set and every results page is appended
+#     with the engine's current top candidates as the expected answer (review and correct these by hand)
+#   - seeded: built here from the offer files, using the other providers' names for the same device as the
+#     candidate list and a simple canonical name as the label
+#
+#   python scrapers/match_benchmark.py                      # seed from data/ and report
+#   python scrapers/match_benchmark.py --corpus cases.jsonl # report on a captured corpus
+#   python scrapers/match_benchmark.py --write-seed cases.jsonl
+#
+# match_regressions.jsonl holds hand-checked cases the engine once got wrong and is evaluated on every run.
+# every case is also scored with the per-site scorers the engine replaced (match_baseline.py); a case either of them
+# picked correctly that the engine now gets wrong is a regression and fails the run
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+REGRESSION_CORPUS = Path(__file__).resolve().parent / "match_regressions.jsonl"
+
+_BRANDS = {'apple', 'samsung', 'google', 'motorola', 'oneplus', 'nokia', 'nothing', 'xiaomi'}
+# words that never tell two devices apart: colours, connectivity and the providers' bundle wording
+_FILLER = {
+    'black', 'white', 'blue', 'green', 'grey', 'gray', 'silver', 'gold', 'orange', 'pink', 'purple', 'violet',
+    'cobalt', 'sort', 'hvid', 'blå', 'grøn', 'grå', 'obsidian', 'graphite', 'navy', 'mint', 'lavender', 'slate',
+    'midnight', 'starlight', '5g', 'med', 'abonnement',
+}
+# parenthesised colours and bundle notes go, a model year like "(2025)" stays: it's a different generation
+_PARENTHESES = re.compile(r'\((?!\d{4}\))[^)]*\)')
+_STORAGE = re.compile(r'(\d+)\s*(gb|tb)\b')
+
+
+def canonical_name(name: str) -> tuple[str, str | None]:
+    # deliberately independent of product_matching: (device without brand, colour or storage, storage or None)
+    text = normalize(_PARENTHESES.sub('', name))
+    storage = _STORAGE.search(text)
+    text = _STORAGE.sub(' ', text)
+    tokens = [t for t in text.split() if t not in _FILLER]
+    if tokens and tokens[0] in _BRANDS:
+        tokens = tokens[1:]
+    return ' '.join(tokens), ''.join(storage.groups()) if storage else None
+
+
+def is_same_device(query: str, candidate: str) -> bool:
+    # a query without storage accepts any storage variant, just like get_market_price does
+    q_device, q_storage = canonical_name(query)
+    c_device, c_storage = canonical_name(candidate)
+    return q_device == c_device and (q_storage is None or q_storage == c_storage)
+
+
+def seed_corpus() -> list[dict]:
+    names_by_source = {path: set(read_product_names(path, field)) for path, field in PROVIDER_SOURCES}
+
+    # queries: what the market-price scrapers actually looked up, plus every provider name
+    queries: set[str] = set()
+    for prices_file in ('data/pricerunner/pricerunner_prices.json', 'data/prisjagt/prisjagt_prices.json'):
+        path = BASE_DIR / prices_file
+        if path.exists():
+            with path.open(encoding='utf-8') as f:
+                queries.update(json.load(f))
+    for names in names_by_source.values():
+        queries.update(names)
+
+    cases = []
+    for query in sorted(queries):
+        device, _ = canonical_name(query)
+        if not device:
+            continue
+        family = device.split()[0]
+        # candidates: every other listing in the same family, as a comparison site would show them
+        candidates = sorted({
+            name for names in names_by_source.values() for name in names
+            if name != query and canonical_name(name)[0].split()[:1] == [family]
+        })
+        if len(candidates) < 2:
+            continue
+        expected = [c for c in candidates if is_same_device(query, c)]
+        cases.append({"query": query, "candidates": candidates, "expected": expected})
+    return cases
+
+
+def load_corpus(path: Path) -> list[dict]:
+    with path.open(encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_corpus(path: Path, cases: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('w', encoding='utf-8') as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False) + '\n')
+
+
+def pick(case: dict, score: Callable[[str, str], float] | None = None) -> str | None:
+    # the engine's pick, or the pick of another score_match-like function such as a baseline scorer
+    if score is None:
+        ranked = rank_candidates(case["query"], case["candidates"])
+    else:
+        ranked = [(score(case["query"], title), i) for i, title in enumerate(case["candidates"])]
+        ranked.sort(key=lambda s: s[0], reverse=True)
+    if not ranked or ranked[0][0] < MATCH_THRESHOLD:
+        return None
+    return case["candidates"][ranked[0][1]]
+
+
+def is_correct(case: dict, chosen: str | None) -> bool:
+    return chosen in case["expected"] if case["expected"] else chosen is None
+
+
+def regressions(cases: list[dict]) -> list[dict]:
+    # cases a baseline scorer got right and the engine gets wrong
+    found = []
+    for case in cases:
+        chosen = pick(case)
+        if is_correct(case, chosen):
+            continue
+        for site, score in BASELINE_SCORERS.items():
+            baseline = pick(case, score)
+            if is_correct(case, baseline):
+                found.append({"query": case["query"], "picked": chosen, "baseline": site, "baseline_picked": baseline})
+                break
+    return found
+
+
+def evaluate(cases: list[dict]) -> dict:
+    tp = fp = fn = tn = 0
+    misses = []
+    for case in cases:
+        chosen = pick(case)
+        expected = case["expected"]
+        if chosen is not None and chosen in expected:
+            tp += 1
+            continue
+        if chosen is None and not expected:
+            tn += 1
+            continue
+        if chosen is not None:
+            fp += 1
+        if expected:
+            fn += 1
+        misses.append({"query": case["query"], "picked": chosen, "expected": expected})
+    return {
+        "cases": len(cases),
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "true_positives": tp,
+        "false_positives": fp,
+        "false_negatives": fn,
+        "true_negatives": tn,
+        "misses": misses,
+    }
+
+
+def _best_of(repeat: int, fn: Callable[[], None]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def benchmark(cases: list[dict], repeat: int = 5) -> dict:
+    pairs = [(case["query"], title) for case in cases for title in case["candidates"]]
+
+    def score_all_cold():
+        # the first time a run sees each title
+        product_matching.clear_caches()
+        for query, title in pairs:
+            score_match(query, title)
+
+    def score_all_warm():
+        for query, title in pairs:
+            score_match(query, title)
+
+    def rank_all():
+        for case in cases:
+            rank_candidates(case["query"], case["candidates"])
+
+    cold = _best_of(repeat, score_all_cold)
+    warm = _best_of(repeat, score_all_warm)
+    rank = _best_of(repeat, rank_all)
+    candidates_per_case = [len(case["candidates"]) for case in cases] or [0]
+    return {
+        "pairs": len(pairs),
+        "score_match_cold_per_sec": len(pairs) / cold if cold else 0.0,
+        "score_match_warm_per_sec": len(pairs) / warm if warm else 0.0,
+        "rank_candidates_cases_per_sec": len(cases) / rank if rank else 0.0,
+        "median_candidates_per_case": statistics.median(candidates_per_case),
+    }
+
+
+def report(cases: list[dict], repeat: int, show_misses: bool) -> int:
+    # returns the number of regressions against the baseline scorers
+    accuracy = evaluate(cases)
+    regressed = regressions(cases)
+    speed = benchmark(cases, repeat)
+
+    print(f"cases:      {accuracy['cases']}  ({speed['pairs']} query/title pairs, "
+          f"median {speed['median_candidates_per_case']:.0f} candidates per case)")
+    print(f"precision:  {accuracy['precision']:.3f}  recall: {accuracy['recall']:.3f}  "
+          f"(tp={accuracy['true_positives']} fp={accuracy['false_positives']} "
+          f"fn={accuracy['false_negatives']} tn={accuracy['true_negatives']})")
+    print(f"score_match:     {speed['score_match_cold_per_sec']:,.0f} pairs/s cold, "
+          f"{speed['score_match_warm_per_sec']:,.0f} pairs/s warm")
+    print(f"rank_candidates: {speed['rank_candidates_cases_per_sec']:,.0f} results pages/s")
+
+    print(f"regressions against the baseline scorers: {len(regressed)}")
+    for case in regressed:
+        print(f"  {case['query']!r}: picked {case['picked']!r}, "
+              f"{case['baseline']} baseline picked {case['baseline_picked']!r}")
+
+    if show_misses:
+        for miss in accuracy["misses"]:
+            print(f"  {miss['query']!r}: picked {miss['picked']!r}, expected {miss['expected']!r}")
+    return len(regressed)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline speed and accuracy benchmark for product matching.")
+    parser.add_argument("--corpus", type=Path, help="JSONL corpus to evaluate (default: seed one from data/)")
+    parser.add_argument("--write-seed", type=Path, help="write the seeded corpus to this path and exit")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions, best one is reported")
+    parser.add_argument("--backend", choices=[*SIMILARITY_BACKENDS, "all"],
+                        help="similarity backend to benchmark (default: MATCH_SIMILARITY), or compare all of them")
+    parser.add_argument("--show-misses", action="store_true", help="list every case the engine got wrong")
+    args = parser.parse_args(argv)
+
+    if args.write_seed:
+        cases = seed_corpus()
+        write_corpus(args.write_seed, cases)
+        print(f"Wrote {len(cases)} cases to {args.write_seed}")
+        return 0
+
+    cases = load_corpus(args.corpus) if args.corpus else seed_corpus()
+    cases += load_corpus(REGRESSION_CORPUS)
+    backends = list(SIMILARITY_BACKENDS) if args.backend == "all" else [args.backend] if args.backend else [None]
+    regressed = 0
+    for backend in backends:
+        if backend:
+            set_similarity_backend(backend)
+            print(f"\n[{backend}]")
+        regressed += report(cases, args.repeat, args.show_misses)
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
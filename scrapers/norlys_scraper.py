@@ -1,11 +1,24 @@
 import re
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, apply_name_substitutions
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from playwright.sync_api import ViewportSize
+from checkpoint import Checkpoint
+from detail_cache import DetailCache, fingerprint
+from page_pool import PagePool
+from page_waits import wait_until_ready
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, http_session, now_timestamp, write_json, log, warn, apply_name_substitutions
 
 BASE_DIR  = Path(__file__).parent.parent
 IMAGE_DIR = BASE_DIR / "public" / "images" / "norlys"
 DATA_DIR  = BASE_DIR / "data" / "norlys"
+# the variant API calls each product page made, keyed by product slug, as captured by the last browser visit. they
+# are replayed for up to DETAIL_CACHE_MAX_AGE_DAYS, then the page is visited again so a change in the subscription the
+# site preselects (and so in what the calls price) is picked up. expiry is spread so only some pages are due each run
+VARIANT_CALLS_FILE = DATA_DIR / "norlys_variant_calls.json"
+VARIANT_CALLS_EXPIRY_SPREAD = 0.5
 VIEWPORT: ViewportSize = {"width": 1920, "height": 1080}
 
 SHOP_BASE   = "https://shop.norlys.dk"
@@ -24,6 +37,14 @@ CATEGORY_URLS: dict[str, str] = {
 
 MAX_SUBSCRIPTIONS = 5
 
+VARIANT_API = "/api/olympus/commerce/catalog/products/variant/"
+# parallel variant API calls in direct mode
+NORLYS_API_WORKERS = int(os.environ.get("NORLYS_API_WORKERS", "6"))
+# "direct" calls the variant API for every product whose calls were learned recently, or can be built from the calls
+# every learned product shares, and only visits the pages of the rest (or ones whose calls expired or fail), "browser"
+# always visits every product page
+NORLYS_MODE = os.environ.get("NORLYS_MODE", "direct")
+
 # blacklisted names. this is needed because norlys offers gaming laptops which are very poorly named making them extremely hard
 # to reliably extract price data from. these products can not be filtered out by scraping specific parts of the site
 # because they are hidden on even non-gaming related pages.
@@ -69,7 +90,7 @@ def download_image(image_url: str, product_name: str) -> str:
 def get_product_links_from_listing(page, cat_url: str) -> list[str]:
     try:
         page.goto(cat_url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2500)
+        wait_until_ready(page, "norlys listing", 2500, selector='a[href*="/shop/"][href*="/#/"]', dom_stable_ms=300)
     except Exception as e:
         log(f"  Could not load {cat_url}: {e}")
         return []
@@ -109,34 +130,122 @@ def extract_price_data(price: dict) -> dict | None:
     }
 
 
-def scrape_product(page, href: str, product_type: str, saved_at: str) -> dict | None:
-    product_url = SHOP_BASE + href if href.startswith("/") else href
+def pin_variant_url(url: str) -> str:
+    # force the shop context and installment plan this scraper prices against, whatever the page happened to use
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    for key, value in (("contextId", CONTEXT_ID), ("installment", INSTALLMENT)):
+        if key in query:
+            query[key] = value
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def href_fields(href: str) -> dict[str, str]:
+    # the parts of a product link a variant call can be built from: /shop/{brand}/{product}/#/{color}/{storage}/{plan}
+    path, _, fragment = href.partition("#")
+    fields: dict[str, str] = {}
+    match = re.search(r"/shop/([^/]+)/([^/]+)/", path)
+    if match:
+        fields["brand"], fields["product"] = match.groups()
+    for name, value in zip(("color", "storage", "plan"), fragment.strip("/").split("/")):
+        if value:
+            fields[name] = value
+    # last, so a value shared with a product field is filled with the pinned one
+    fields["context_id"] = CONTEXT_ID
+    fields["installment"] = INSTALLMENT
+    return fields
+
+
+def variant_template(url: str, fields: dict[str, str]) -> tuple:
+    # a captured variant call with every path segment and query value that came from the product link replaced by
+    # the name of its field, so the same call can be made for another product
+    parts = urlsplit(url)
+    by_value = {value: name for name, value in fields.items()}
+
+    def part(value: str) -> tuple[str | None, str]:
+        return (by_value[value], "") if value in by_value else (None, value)
+
+    path = tuple(part(segment) for segment in parts.path.split("/"))
+    query = tuple((key, part(value)) for key, value in parse_qsl(parts.query, keep_blank_values=True))
+    return parts.scheme, parts.netloc, path, query
+
+
+def fill_variant_template(template: tuple, fields: dict[str, str]) -> str | None:
+    scheme, netloc, path, query = template
+
+    def value(part: tuple[str | None, str]) -> str | None:
+        field, text = part
+        return fields.get(field) if field else text
+
+    segments = [value(part) for part in path]
+    params = [(key, value(part)) for key, part in query]
+    if None in segments or any(v is None for _, v in params):
+        return None
+    return pin_variant_url(urlunsplit((scheme, netloc, "/".join(segments), urlencode(params), "")))
+
 
-    # collect all variant API responses: one fires on page load (site pre-selects the
-    # cheapest subscription), then one per subscription card click.
+def learn_variant_templates(captured: dict[str, tuple[str, list[str]]]) -> list[tuple] | None:
+    # captured: slug -> (href, the variant calls its page made). the calls of one product, turned into templates, are
+    # trusted for products that were never visited only once they rebuild the captured calls of every other product
+    # exactly — a call keyed by an id the link doesn't carry can't be derived, and then new products are visited
+    if len(captured) < 2:
+        return None
+    (href, urls), *others = captured.values()
+    templates = [variant_template(url, href_fields(href)) for url in urls[:MAX_SUBSCRIPTIONS]]
+    for other_href, other_urls in others:
+        filled = [fill_variant_template(template, href_fields(other_href)) for template in templates]
+        if filled != [pin_variant_url(url) for url in other_urls[:MAX_SUBSCRIPTIONS]]:
+            return None
+    return templates
+
+
+def fetch_variants_direct(session, urls: list[str]) -> list[dict]:
+    # call the variant API the way the product page does; raises when a call fails or the response changed shape
+    responses = []
+    for url in urls[:MAX_SUBSCRIPTIONS]:
+        response = session.get(pin_variant_url(url), headers={"Accept": "application/json"}, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, dict) or not isinstance(data.get("price"), dict):
+            raise ValueError(f"unexpected variant response from {url}")
+        responses.append(data)
+    return responses
+
+
+def fetch_variants_browser(page, href: str) -> tuple[list[dict], list[str]] | None:
+    # visit the product page and collect the variant API responses it fires (the site pre-selects the cheapest
+    # subscription on load), along with the call URLs so the next run can make them directly
+    product_url = SHOP_BASE + href if href.startswith("/") else href
     api_responses: list[dict] = []
+    urls: list[str] = []
 
     def handle_response(response):
-        if "/api/olympus/commerce/catalog/products/variant/" in response.url:
+        if VARIANT_API in response.url:
             try:
                 api_responses.append(response.json())
+                urls.append(response.url)
             except Exception:
                 pass
 
     page.on("response", handle_response)
-
     try:
         page.goto(product_url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2000)
+        # the preselected variant's API response is all we need
+        wait_until_ready(page, "norlys product", 2000, condition=lambda: api_responses)
     except Exception as e:
         log(f"  Could not load {product_url}: {e}")
-        page.remove_listener("response", handle_response)
         return None
+    finally:
+        page.remove_listener("response", handle_response)
 
     if not api_responses:
         log(f"  No variant API response captured for {href}")
-        page.remove_listener("response", handle_response)
         return None
+    return api_responses, urls
+
+
+def build_offer(api_responses: list[dict], href: str, product_type: str, saved_at: str) -> dict | None:
+    product_url = SHOP_BASE + href if href.startswith("/") else href
 
     initial_data = api_responses[0]
     display_name = initial_data.get("displayName", "")
@@ -150,8 +259,6 @@ def scrape_product(page, href: str, product_type: str, saved_at: str) -> dict |
         raw_image = SHOP_BASE + raw_image
     local_image = download_image(raw_image, product_name)
 
-    page.remove_listener("response", handle_response)
-
     best: dict | None = None
 
     for data in api_responses:
@@ -189,8 +296,37 @@ def scrape_product(page, href: str, product_type: str, saved_at: str) -> dict |
     }
 
 
+def make_page(browser):
+    context = browser.new_context(
+        user_agent=(
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0.0.0 Safari/537.36"
+        ),
+        viewport=VIEWPORT,
+        locale="da-DK",
+    )
+    block_unneeded_requests(context, "norlys", allow=("/api/olympus/",))
+    page = context.new_page()
+
+    # accept cookies once on the homepage
+    log("Accepting cookies...")
+    try:
+        page.goto(SHOP_BASE, wait_until="networkidle", timeout=30000)
+    except BaseException:
+        context.close()
+        raise
+    wait_until_ready(page, "norlys cookie banner", 2000, selector="button.coi-banner__accept")
+    try:
+        page.click("button.coi-banner__accept", timeout=4000)
+        wait_until_ready(page, "norlys cookie banner closed", 1200, selector="button.coi-banner__accept", state="hidden")
+        log("  Cookies accepted")
+    except Exception:
+        pass
+    return context, page
+
 
-def scrape_norlys():
+def scrape_norlys(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -198,50 +334,107 @@ def scrape_norlys():
     all_offers = []
     seen_slugs: set[str] = set()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-            viewport=VIEWPORT,
-            locale="da-DK",
-        )
-        page = context.new_page()
-
-        # accept cookies once on the homepage
-        log("Accepting cookies...")
-        page.goto(SHOP_BASE, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2000)
-        try:
-            page.click("button.coi-banner__accept", timeout=4000)
-            page.wait_for_timeout(1200)
-            log("  Cookies accepted")
-        except Exception:
-            pass
+    with browser_session(browser) as browser:
+        context, page = make_page(browser)
 
-        for cat_url, product_type in CATEGORY_URLS.items():
-            log(f"\nScraping category: {cat_url} (type={product_type})")
-
-            product_hrefs = get_product_links_from_listing(page, cat_url)
-
-            for href in product_hrefs:
-                slug = re.sub(r"/#/.*$", "/", href)
-                if slug in seen_slugs:
+        # the browser discovers the products; their prices come from the variant API
+        products: list[tuple[str, str, str]] = []
+        try:
+            for cat_url, product_type in CATEGORY_URLS.items():
+                log(f"\nScraping category: {cat_url} (type={product_type})")
+
+                product_hrefs = get_product_links_from_listing(page, cat_url)
+
+                for href in product_hrefs:
+                    slug = re.sub(r"/#/.*$", "/", href)
+                    if slug in seen_slugs:
+                        continue
+                    seen_slugs.add(slug)
+                    products.append((slug, href, product_type))
+        finally:
+            context.close()
+
+        # calls learned for another shop context or installment plan price something else
+        variant_calls = DetailCache(VARIANT_CALLS_FILE, expiry_spread=VARIANT_CALLS_EXPIRY_SPREAD)
+        calls_print = fingerprint(CONTEXT_ID, INSTALLMENT)
+        variant_requests: dict[str, list[str]] = {}
+        for slug, _, _ in products:
+            urls = variant_calls.get(slug, calls_print)
+            if urls:
+                variant_requests[slug] = urls
+        responses_by_slug: dict[str, list[dict]] = {}
+
+        # new products get their calls from the template the captured ones share; those calls aren't stored, so the
+        # template is only ever checked against calls a page really made. expired products are still visited — a few
+        # per run, thanks to the spread expiry — which keeps enough fresh captures around to check it against
+        templates = learn_variant_templates({
+            slug: (href, variant_requests[slug]) for slug, href, _ in products if slug in variant_requests
+        })
+        if templates:
+            derived = 0
+            for slug, href, _ in products:
+                if slug in variant_requests or slug in variant_calls.entries:
                     continue
-                seen_slugs.add(slug)
-
-                offer = scrape_product(page, href, product_type, saved_at)
-                if offer and not is_product_blacklisted(offer.get("product_name", "")):
-                    all_offers.append(offer)
-
-        context.close()
-        browser.close()
+                urls = [fill_variant_template(template, href_fields(href)) for template in templates]
+                if None not in urls:
+                    variant_requests[slug] = urls
+                    derived += 1
+            log(f"Built variant calls for {derived} products from the learned template")
+
+        # products a crashed run already priced are neither called nor visited again
+        journal = Checkpoint("norlys")
+        for slug, _, _ in products:
+            done = journal.get(slug)
+            if done is not None:
+                responses_by_slug[slug] = done["responses"]
+                if done["requests"]:
+                    variant_calls.put(slug, calls_print, done["requests"])
+
+        if NORLYS_MODE == "direct":
+            known = [slug for slug, _, _ in products if variant_requests.get(slug) and slug not in responses_by_slug]
+            log(f"\nCalling the variant API for {len(known)} known products...")
+            session = http_session(pool_size=NORLYS_API_WORKERS)
+
+            def fetch(slug):
+                try:
+                    return slug, fetch_variants_direct(session, variant_requests[slug])
+                except Exception as e:
+                    return slug, e
+
+            # results are logged here rather than in the pool threads, which don't carry the scraper's log prefix
+            with ThreadPoolExecutor(max_workers=NORLYS_API_WORKERS) as pool:
+                for slug, result in pool.map(fetch, known):
+                    if isinstance(result, Exception):
+                        warn(f"Variant API failed for {slug}, visiting the page instead: {result}")
+                    else:
+                        responses_by_slug[slug] = result
+                        journal.record(slug, {"responses": result, "requests": None})
+            session.close()
+
+        # new products, and ones whose direct calls failed, are visited — which also records their calls
+        to_visit = [(slug, href) for slug, href, _ in products if slug not in responses_by_slug]
+        pages = PagePool(browser, make_page, name="norlys", domain="norlys.dk")
+        for (slug, _), result in zip(to_visit, pages.map([href for _, href in to_visit], fetch_variants_browser)):
+            if result is None:
+                continue
+            responses_by_slug[slug], urls = result
+            variant_calls.put(slug, calls_print, urls)
+            journal.record(slug, {"responses": result[0], "requests": result[1]})
+
+    # products no longer listed are dropped so the file doesn't grow forever
+    variant_calls.prune(seen_slugs)
+    variant_calls.save()
+
+    for slug, href, product_type in products:
+        if slug not in responses_by_slug:
+            continue
+        offer = build_offer(responses_by_slug[slug], href, product_type, saved_at)
+        if offer and not is_product_blacklisted(offer.get("product_name", "")):
+            all_offers.append(offer)
 
     output_path = DATA_DIR / "norlys_offers.json"
     write_json(output_path, all_offers)
+    journal.finish()
 
     log(f"\nDone. Saved {len(all_offers)} offers to '{output_path}'")
 
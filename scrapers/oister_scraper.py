@@ -1,8 +1,8 @@
 import requests
-from bs4 import BeautifulSoup
 import re
 from pathlib import Path
 from typing import TypedDict
+from html_parsing import parse_html
 from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary
 
 # setup
@@ -73,7 +73,7 @@ def scrape_oister():
         log(f"Error! Could not fetch the page. Status code: {response.status_code}")
         return
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = parse_html(response.text, "oister listing")
 
     offer_list = soup.find_all('div', class_='col--double-padding-bottom')
     promo_card = soup.find('div', class_='section-promo-voice-card')
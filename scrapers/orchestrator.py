@@ -0,0 +1,318 @@
+import argparse
+import dataclasses
+import importlib
+import json
+import queue
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable
+import image_processing
+from market_lookup import MARKET_PRICE_SHARDS
+from page_pool import DETAIL_PAGE_WORKERS
+from page_waits import timing_summary
+from provider_sources import BASE_DIR, PROVIDER_SOURCES, ProductFeed
+from scraper_utils import (IMAGE_ROOT, IMAGE_STORE_DIR, browser_session, collect_image_garbage, log, log_scope, error,
+                           wait_for_image_downloads, write_json)
+
+
+@dataclasses.dataclass
+class ScraperSpec:
+    name: str
+    module: str
+    function: str
+    uses_browser: bool = True
+    # the provider file this scraper produces (an entry of PROVIDER_SOURCES)
+    output: str | None = None
+    # market-price scrapers consume the product names from every provider output
+    reads_provider_data: bool = False
+
+
+SCRAPERS: list[ScraperSpec] = [
+    ScraperSpec("telmore", "telmore_scraper", "scrape_telmore", output="data/telmore/telmore_offers.json"),
+    ScraperSpec("telmore_tilgift", "telmore_tilgift_scraper", "scrape_telmore_tilgift", output="data/telmore/telmore_tilgift_offers.json"),
+    ScraperSpec("oister", "oister_scraper", "scrape_oister", uses_browser=False, output="data/oister/oister_offers.json"),
+    ScraperSpec("elgiganten", "elgiganten_scraper", "scrape_elgiganten", output="data/elgiganten/elgiganten_offers.json"),
+    ScraperSpec("cbb", "cbb_scraper", "scrape_cbb", output="data/cbb/cbb_offers.json"),
+    ScraperSpec("3", "3_scraper", "scrape_3", output="data/3/3_offers.json"),
+    ScraperSpec("yousee", "yousee_scraper", "scrape_yousee", output="data/yousee/yousee_offers.json"),
+    ScraperSpec("norlys", "norlys_scraper", "scrape_norlys", output="data/norlys/norlys_offers.json"),
+    ScraperSpec("callme", "callme_scraper", "scrape_callme", output="data/callme/callme_offers.json"),
+    ScraperSpec("pricerunner", "pricerunner_scraper", "scrape_pricerunner", reads_provider_data=True),
+    ScraperSpec("prisjagt", "prisjagt_scraper", "scrape_prisjagt", reads_provider_data=True),
+]
+
+
+@dataclasses.dataclass
+class RunResult:
+    name: str
+    status: str
+    seconds: float
+    error: str = ""
+
+
+def load_scrapers(specs: list[ScraperSpec]) -> dict[str, Callable]:
+    # import every scraper module once up front — importlib is needed because "3_scraper" is not a valid identifier
+    return {spec.name: getattr(importlib.import_module(spec.module), spec.function) for spec in specs}
+
+
+def run_one(spec: ScraperSpec, scrape: Callable, get_browser: Callable, **kwargs) -> RunResult:
+    log(f"\n=== {spec.name} ===")
+    started = time.perf_counter()
+    try:
+        if spec.uses_browser:
+            scrape(get_browser(), **kwargs)
+        else:
+            scrape(**kwargs)
+    except Exception as e:
+        error(f"{spec.name} failed: {e}")
+        traceback.print_exc()
+        return RunResult(spec.name, "failed", time.perf_counter() - started, str(e))
+    return RunResult(spec.name, "ok", time.perf_counter() - started)
+
+
+class _LazyBrowser:
+    # launches Chromium on first use so runs that only contain requests-based scrapers never start one
+
+    def __init__(self, stack: ExitStack, headless: bool):
+        self._stack = stack
+        self._headless = headless
+        self._browser = None
+
+    def __call__(self):
+        if self._browser is None:
+            self._browser = self._stack.enter_context(browser_session(headless=self._headless))
+        return self._browser
+
+
+class _Pipeline:
+    # a two-level DAG: provider scrapers produce offer files, market-price scrapers consume the product names
+    # in them. each consumer gets its own de-duplicating feed; a provider's names are published the moment it
+    # finishes, so price lookups overlap with the providers that are still running
+
+    def __init__(self, specs: list[ScraperSpec]):
+        self.producers = [spec for spec in specs if not spec.reads_provider_data]
+        self.consumers = [spec for spec in specs if spec.reads_provider_data]
+        self.feeds = {spec.name: ProductFeed() for spec in self.consumers}
+        self._name_fields = dict(PROVIDER_SOURCES)
+
+        # provider files that nobody in this run will rewrite are published straight away
+        produced = {spec.output for spec in self.producers}
+        for path in self._name_fields:
+            if path not in produced:
+                self._publish(path)
+
+    def _publish(self, path: str) -> None:
+        for feed in self.feeds.values():
+            feed.publish_file(path, self._name_fields[path])
+
+    def producer_done(self, spec: ScraperSpec) -> None:
+        # a failed provider leaves its previous file in place, which is still worth looking up
+        if spec.output in self._name_fields:
+            self._publish(spec.output)
+
+    def close(self) -> None:
+        for feed in self.feeds.values():
+            feed.close()
+
+
+def run_pool(specs: list[ScraperSpec], scrapers: dict[str, Callable], *, headless: bool, workers: int,
+             on_done: Callable[[ScraperSpec], None]) -> dict[str, RunResult]:
+    # a bounded pool of worker threads pulling scrapers off a shared queue. the sync Playwright API can't be
+    # shared across threads, so each worker launches its own Chromium and every scraper still gets an isolated
+    # context on it. a failing scraper only fails its own result; its output file is left untouched
+    tasks: queue.SimpleQueue[ScraperSpec] = queue.SimpleQueue()
+    for spec in specs:
+        tasks.put(spec)
+    results: dict[str, RunResult] = {}
+
+    def work() -> None:
+        with ExitStack() as stack:
+            get_browser = _LazyBrowser(stack, headless)
+            while True:
+                try:
+                    spec = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                with log_scope(spec.name):
+                    results[spec.name] = run_one(spec, scrapers[spec.name], get_browser)
+                on_done(spec)
+
+    threads = [threading.Thread(target=work, name=f"scraper-worker-{i}") for i in range(min(workers, len(specs)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run(specs: list[ScraperSpec], *, headless: bool = True, workers: int = 1) -> list[RunResult]:
+    scrapers = load_scrapers(specs)
+    pipeline = _Pipeline(specs)
+    results: dict[str, RunResult] = {}
+
+    if workers == 1:
+        # one Chromium for the whole run; every scraper opens (and closes) its own isolated context on it.
+        # consumers run last, so their feeds already hold every provider's names
+        with ExitStack() as stack:
+            get_browser = _LazyBrowser(stack, headless)
+            for spec in pipeline.producers:
+                results[spec.name] = run_one(spec, scrapers[spec.name], get_browser)
+                pipeline.producer_done(spec)
+            pipeline.close()
+            for spec in pipeline.consumers:
+                results[spec.name] = run_one(spec, scrapers[spec.name], get_browser, products=pipeline.feeds[spec.name])
+        return [results[spec.name] for spec in specs]
+
+    # consumers spend most of their time waiting on their feed, so they get dedicated threads (and browsers)
+    # next to the provider pool rather than taking a worker slot from it. that trades memory for wall time: every
+    # worker, consumer, extra market-price shard and detail-page helper is a Chromium of its own
+    browsers = (min(workers, len(pipeline.producers)) + len(pipeline.consumers) * MARKET_PRICE_SHARDS
+                + DETAIL_PAGE_WORKERS - 1)
+    log(f"Running {len(specs)} scrapers on {workers} workers, up to {browsers} browsers at once")
+    def consume(spec: ScraperSpec) -> None:
+        with ExitStack() as stack, log_scope(spec.name):
+            results[spec.name] = run_one(spec, scrapers[spec.name], _LazyBrowser(stack, headless),
+                                         products=pipeline.feeds[spec.name])
+
+    consumer_threads = [threading.Thread(target=consume, args=(spec,), name=f"market-{spec.name}")
+                        for spec in pipeline.consumers]
+    for thread in consumer_threads:
+        thread.start()
+    try:
+        results.update(run_pool(pipeline.producers, scrapers, headless=headless, workers=workers,
+                                on_done=pipeline.producer_done))
+    finally:
+        pipeline.close()
+        for thread in consumer_threads:
+            thread.join()
+
+    return [results[spec.name] for spec in specs]
+
+
+def log_summary(results: list[RunResult], total_seconds: float) -> None:
+    log("\nRun summary:")
+    width = max((len(r.name) for r in results), default=0)
+    for r in results:
+        line = f"  {r.name.ljust(width)}  {r.status:<6}  {r.seconds:7.1f}s"
+        if r.error:
+            line += f"  ({r.error})"
+        log(line)
+    log(f"  {'total'.ljust(width)}  {'':<6}  {total_seconds:7.1f}s")
+
+    waits = timing_summary()
+    if waits:
+        log("\nPage waits (time spent vs. the fixed sleeps they replace):")
+        width = max(len(w.label) for w in waits)
+        for w in waits:
+            log(f"  {w.label.ljust(width)}  {w.count:4d}x  {w.waited_ms / 1000:7.1f}s of {w.budget_ms / 1000:7.1f}s"
+                f"  ({w.timeouts} timed out)")
+
+    images = image_processing.stats
+    if images.count:
+        log(f"\nImages: {images.count} downloaded, {format_mb(images.original_bytes)} as served, "
+            f"{format_mb(images.final_bytes)} saved")
+
+
+def format_mb(size: int) -> str:
+    return f"{size / 1_000_000:.1f} MB"
+
+
+def select_specs(names: list[str]) -> list[ScraperSpec]:
+    if not names:
+        return list(SCRAPERS)
+    known = {spec.name for spec in SCRAPERS}
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        raise SystemExit(f"Unknown scraper(s): {', '.join(unknown)}. Known: {', '.join(sorted(known))}")
+    # keep registry order for the run summary
+    return [spec for spec in SCRAPERS if spec.name in names]
+
+
+def unfinished_specs(specs: list[ScraperSpec], summary_path: Path) -> list[ScraperSpec]:
+    # a run that died before writing its summary finished nothing as far as a retry can tell
+    if not summary_path.exists():
+        return specs
+    with summary_path.open(encoding="utf-8") as f:
+        finished = {r["name"] for r in json.load(f)["scrapers"] if r["status"] == "ok"}
+    return [spec for spec in specs if spec.name not in finished]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m scrapers", description="Run the provider and market-price scrapers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run scrapers against one shared browser")
+    run_parser.add_argument("names", nargs="*", help="scrapers to run (default: all)")
+    run_parser.add_argument("-w", "--workers", type=int, default=1,
+                            help="number of provider scrapers to run in parallel, each worker with its own browser; "
+                                 "above 1, market-price lookups also start as soon as each provider finishes, each "
+                                 "on a browser of its own, so expect roughly workers + 4 Chromiums (default: 1)")
+    run_parser.add_argument("--headed", action="store_true", help="show the browser window")
+    run_parser.add_argument("--summary", type=Path, help="also write the run summary as JSON to this path")
+    run_parser.add_argument("--retry-failed", type=Path, metavar="SUMMARY",
+                            help="only run the scrapers that did not finish in the run that wrote this --summary "
+                                 "(all of them if it never got that far); they resume from their checkpoints")
+
+    commands.add_parser("list", help="list available scrapers")
+
+    convert_parser = commands.add_parser("convert-images",
+                                         help="re-encode the per-provider product images as resized WebP, in place; the "
+                                              "content-addressed store is already transcoded")
+    convert_parser.add_argument("--dry-run", action="store_true", help="only report how much would be saved")
+
+    gc_parser = commands.add_parser("gc-images", help="delete the saved images no offer file references any more")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for spec in SCRAPERS:
+            log(spec.name)
+        return 0
+
+    if args.command == "convert-images":
+        converted = image_processing.convert_store(IMAGE_ROOT, skip=IMAGE_STORE_DIR, dry_run=args.dry_run)
+        log(f"{converted.count} images: {format_mb(converted.original_bytes)} -> {format_mb(converted.final_bytes)}"
+            + (" (dry run, nothing written)" if args.dry_run else ""))
+        return 0
+
+    if args.command == "gc-images":
+        deleted, freed = collect_image_garbage(dry_run=args.dry_run)
+        log(f"{deleted} unreferenced images, {format_mb(freed)}"
+            + (" (dry run, nothing deleted)" if args.dry_run else " deleted"))
+        return 0
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    specs = select_specs(args.names)
+    if args.retry_failed:
+        specs = unfinished_specs(specs, args.retry_failed)
+        if not specs:
+            log("Every scraper finished, nothing to retry")
+            return 0
+        log(f"Retrying: {', '.join(spec.name for spec in specs)}")
+    started = time.perf_counter()
+    results = run(specs, headless=not args.headed, workers=args.workers)
+    # images for products a scraper dropped are still queued; count them in the run time
+    wait_for_image_downloads()
+    total_seconds = time.perf_counter() - started
+
+    log_summary(results, total_seconds)
+    if args.summary:
+        write_json(args.summary, {
+            "total_seconds": round(total_seconds, 1),
+            "scrapers": [dataclasses.asdict(r) | {"seconds": round(r.seconds, 1)} for r in results],
+            "images": dataclasses.asdict(image_processing.stats),
+            "page_waits": [dataclasses.asdict(w) | {"waited_ms": round(w.waited_ms), "budget_ms": round(w.budget_ms)}
+                           for w in timing_summary()],
+        })
+
+    return 1 if any(r.status != "ok" for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
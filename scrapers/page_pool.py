@@ -0,0 +1,178 @@
+import atexit
+import functools
+import os
+import queue
+import threading
+from contextlib import ExitStack
+from typing import Any, Callable, Sequence
+from scraper_utils import browser_session, domain_slot, log_scope, error, warn
+
+# how many detail pages one scraper keeps open at once
+DETAIL_PAGE_WORKERS = int(os.environ.get("DETAIL_PAGE_WORKERS", "3"))
+# politeness cap: detail pages loading at once per site, across every scraper in the process
+MAX_PAGES_PER_DOMAIN = int(os.environ.get("DETAIL_PAGES_PER_DOMAIN", "3"))
+
+
+class _Job:
+    # a PagePool worker handed to a helper thread. it may still be waiting behind another pool's job when its own
+    # pool has already drained the queue, in which case it is dropped rather than waited for
+
+    def __init__(self, fn: Callable) -> None:
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._state = "pending"
+        self._done = threading.Event()
+
+    def run(self, browser) -> None:
+        with self._lock:
+            if self._state == "cancelled":
+                return
+            self._state = "running"
+        try:
+            self.fn(browser)
+        finally:
+            self._done.set()
+
+    def cancel_or_wait(self) -> None:
+        with self._lock:
+            if self._state == "pending":
+                self._state = "cancelled"
+                return
+        self._done.wait()
+
+
+class _HelperThread(threading.Thread):
+    # a long-lived thread with one browser of its own, launched on its first job and reused by every later one
+
+    def __init__(self, index: int, headless: bool) -> None:
+        super().__init__(name=f"page-helper-{index}{'' if headless else '-headed'}", daemon=True)
+        self.headless = headless
+        self.jobs: queue.SimpleQueue[_Job | None] = queue.SimpleQueue()
+
+    def run(self) -> None:
+        with ExitStack() as stack:
+            browser = None
+            while (job := self.jobs.get()) is not None:
+                if browser is not None and not browser.is_connected():
+                    # crashed: relaunch rather than failing every later job
+                    stack.close()
+                    browser = None
+                if browser is None:
+                    try:
+                        browser = stack.enter_context(browser_session(headless=self.headless))
+                    except Exception as e:
+                        # the job stays unclaimed, so its pool does the work itself; the next job tries again
+                        error(f"{self.name} could not launch a browser: {e}")
+                        continue
+                job.run(browser)
+
+
+# helper threads shared by every PagePool in the process, so however many scrapers and map() calls there are, at most
+# DETAIL_PAGE_WORKERS - 1 extra browsers (per headless mode) are ever running
+_helpers: dict[bool, list[_HelperThread]] = {}
+_helpers_lock = threading.Lock()
+
+
+def _helper_threads(count: int, headless: bool) -> list[_HelperThread]:
+    with _helpers_lock:
+        helpers = _helpers.setdefault(headless, [])
+        while len(helpers) < min(count, DETAIL_PAGE_WORKERS - 1):
+            helper = _HelperThread(len(helpers) + 1, headless)
+            helper.start()
+            helpers.append(helper)
+        return helpers[:count]
+
+
+@atexit.register
+def close_helper_threads() -> None:
+    with _helpers_lock:
+        helpers = [helper for group in _helpers.values() for helper in group]
+        _helpers.clear()
+    for helper in helpers:
+        helper.jobs.put(None)
+    for helper in helpers:
+        helper.join()
+
+
+class PagePool:
+    # visits detail pages from several workers at once, each with a context and page built by `make_page`, while
+    # never having more than MAX_PAGES_PER_DOMAIN pages of `domain` loading at the same time.
+    # worker 0 runs in the calling thread on the browser the scraper was given; the others run on the process-wide
+    # helper threads, each on its own browser, since sync Playwright objects can't be used from any thread but their
+    # own — which also rules out sharing one context's pages between workers. a helper busy with another scraper's
+    # pool simply leaves more of the queue to the calling thread
+
+    def __init__(self, browser, make_page: Callable, *, name: str, domain: str, workers: int = DETAIL_PAGE_WORKERS,
+                 headless: bool = True):
+        self.browser = browser
+        self.make_page = make_page
+        self.name = name
+        self.domain = domain
+        self.workers = max(1, min(workers, MAX_PAGES_PER_DOMAIN))
+        self.headless = headless
+
+    def map(self, items: Sequence, visit: Callable[[Any, Any], Any]) -> list:
+        # calls visit(page, item) for every item and returns the results in input order. an item whose visit (or the
+        # context built for it) fails gets None, and its worker carries on with a fresh context
+        if not items:
+            return []
+        tasks: queue.SimpleQueue = queue.SimpleQueue()
+        for index, item in enumerate(items):
+            tasks.put((index, item))
+        results: list = [None] * len(items)
+        slot = domain_slot(self.domain, MAX_PAGES_PER_DOMAIN)
+
+        def close(context) -> None:
+            try:
+                context.close()
+            except Exception as e:
+                warn(f"Could not close {self.name} context: {e}")
+
+        def work(browser) -> None:
+            context = page = None
+            try:
+                while True:
+                    try:
+                        index, item = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    if page is None:
+                        try:
+                            context, page = self.make_page(browser)
+                        except Exception as e:
+                            # e.g. a homepage timeout while warming the context; the next item tries again
+                            warn(f"{item}: could not open a page: {e}")
+                            continue
+                    try:
+                        with slot:
+                            results[index] = visit(page, item)
+                    except Exception as e:
+                        warn(f"{item}: {e}")
+                        close(context)
+                        context = page = None
+            finally:
+                if context is not None:
+                    close(context)
+
+        def guarded_work(worker: int, browser) -> None:
+            try:
+                work(browser)
+            except Exception as e:
+                # the remaining workers keep draining the queue
+                error(f"Page worker {worker} stopped: {e}")
+
+        def work_on_helper(worker: int, browser) -> None:
+            with log_scope(f"{self.name} #{worker}"):
+                guarded_work(worker, browser)
+
+        jobs = []
+        for worker, helper in enumerate(_helper_threads(min(self.workers, len(items)) - 1, self.headless), start=1):
+            job = _Job(functools.partial(work_on_helper, worker))
+            helper.jobs.put(job)
+            jobs.append(job)
+        try:
+            guarded_work(0, self.browser)
+        finally:
+            for job in jobs:
+                job.cancel_or_wait()
+        return results
@@ -0,0 +1,92 @@
+import dataclasses
+import threading
+import time
+from typing import Callable
+
+# resolves once the DOM has had no mutations for `quiet` ms, or with false after `timeout` ms
+_DOM_STABLE_JS = """([quiet, timeout]) => new Promise(resolve => {
+    let timer;
+    const done = stable => { observer.disconnect(); clearTimeout(timer); clearTimeout(hard); resolve(stable); };
+    const observer = new MutationObserver(() => { clearTimeout(timer); timer = setTimeout(() => done(true), quiet); });
+    observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+    timer = setTimeout(() => done(true), quiet);
+    const hard = setTimeout(() => done(false), timeout);
+})"""
+
+POLL_MS = 50
+
+
+@dataclasses.dataclass
+class WaitTiming:
+    label: str
+    count: int = 0
+    waited_ms: float = 0.0
+    budget_ms: float = 0.0
+    timeouts: int = 0
+
+
+# per-label totals for the whole process, reported by the orchestrator's run summary
+timings: dict[str, WaitTiming] = {}
+_timings_lock = threading.Lock()
+
+
+def _record(label: str, waited_ms: float, budget_ms: float, ready: bool) -> None:
+    with _timings_lock:
+        timing = timings.setdefault(label, WaitTiming(label))
+        timing.count += 1
+        timing.waited_ms += waited_ms
+        timing.budget_ms += budget_ms
+        timing.timeouts += not ready
+
+
+def wait_until_ready(
+    page,
+    label: str,
+    budget_ms: float,
+    *,
+    selector: str | None = None,
+    state: str = "visible",
+    js: str | None = None,
+    condition: Callable[[], object] | None = None,
+    dom_stable_ms: float | None = None,
+    timeout_ms: float | None = None,
+) -> bool:
+    # replaces a fixed page.wait_for_timeout(budget_ms): returns as soon as the page is ready instead. ready means,
+    # in this order, that `selector` reached `state`, the `js` function returned truthy, the Python `condition`
+    # (e.g. "an intercepted API response arrived") returned truthy, and the DOM has been quiet for dom_stable_ms.
+    # every check shares one hard timeout (default: the old budget); running out is not an error, the caller
+    # carries on exactly as it did after the old sleep. returns whether every check passed
+    timeout_ms = budget_ms if timeout_ms is None else timeout_ms
+    started = time.perf_counter()
+
+    def remaining() -> float:
+        return max(timeout_ms - (time.perf_counter() - started) * 1000, 0)
+
+    ready = True
+    try:
+        if selector is not None:
+            page.wait_for_selector(selector, state=state, timeout=remaining() or 1)
+        if js is not None:
+            page.wait_for_function(js, timeout=remaining() or 1)
+        if condition is not None:
+            # page.wait_for_timeout keeps the event loop turning, so response handlers still fire while we poll
+            while not condition():
+                if not remaining():
+                    ready = False
+                    break
+                page.wait_for_timeout(min(POLL_MS, remaining()))
+        if dom_stable_ms is not None and ready:
+            ready = bool(page.evaluate(_DOM_STABLE_JS, [dom_stable_ms, remaining()]))
+    except Exception:
+        # Playwright raises TimeoutError once the budget is spent. a navigation mid-wait destroys the execution
+        # context and raises straight away, with budget to spare; the new document isn't known to be ready either,
+        # so both count as not ready and the caller carries on just as it would after a timeout
+        ready = False
+
+    _record(label, (time.perf_counter() - started) * 1000, budget_ms, ready)
+    return ready
+
+
+def timing_summary() -> list[WaitTiming]:
+    with _timings_lock:
+        return sorted(timings.values(), key=lambda t: t.label)
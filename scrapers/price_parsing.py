@@ -0,0 +1,83 @@
+import dataclasses
+import re
+
+# Danish price texts as the shops print them: "4.299 kr.", "10.899,00 kr.", "4.299,-", "39 kr./md.",
+# "Mindstepris 5.022 kr.", "79 kr. i 6 mdr. herefter 129 kr.", "39 kr./md. i 2 md. - Herefter 129 kr."
+# dots (or spaces, "4 299 kr.") group thousands and a comma starts the øre, which are dropped. a group is exactly three
+# digits, so "1 2345" stays two numbers
+
+_AMOUNT = r"\d{1,3}(?:[.\xa0\u202f ]\d{3})+(?!\d)(?:,\d+)?|\d+(?:,\d+)?"
+AMOUNT_PATTERN = re.compile(_AMOUNT)
+KR_AMOUNT_PATTERN = re.compile(rf"({_AMOUNT})[\s\xa0]*(?:kr\b|,-)", re.IGNORECASE)
+MONTHLY_PATTERN = re.compile(rf"({_AMOUNT})[\s\xa0]*kr\.?[\s\xa0]*/[\s\xa0]*md", re.IGNORECASE)
+MIN_COST_PATTERN = re.compile(r"Mindstepris(.*)", re.IGNORECASE | re.DOTALL)
+# an amount that isn't a number of months ("6 mdr.", "6 måneder")
+NOT_MONTHS_PATTERN = re.compile(rf"({_AMOUNT})(?![\d.,]|[\s\xa0]*(?:md|mån))", re.IGNORECASE)
+PROMO_PATTERN = re.compile(
+    rf"({_AMOUNT})[\s\xa0]*kr\.?(?:[\s\xa0]*/[\s\xa0]*md\.?)?[\s\xa0]+i[\s\xa0]+(\d+)[\s\xa0]+mdr?\.?"
+    rf"[\s\xa0]*(?:[-–][\s\xa0]*)?herefter[\s\xa0]+({_AMOUNT})[\s\xa0]*kr",
+    re.IGNORECASE,
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Promo:
+    # "79 kr. i 6 mdr. herefter 129 kr."
+    promo_price: int
+    promo_months: int
+    regular_price: int
+
+    def cost(self, months: int = 6) -> int:
+        # subscription cost over the first `months` months
+        promo_months = min(self.promo_months, months)
+        return promo_months * self.promo_price + (months - promo_months) * self.regular_price
+
+
+def to_int(amount: str) -> int:
+    # "10.899,00" -> 10899
+    return int(re.sub(r"\D", "", amount.split(",")[0]))
+
+
+def parse_price(text: str | None) -> int | None:
+    # the first amount marked as kroner, else the first amount at all
+    if not text:
+        return None
+    kr_amount = KR_AMOUNT_PATTERN.search(text)
+    if kr_amount:
+        return to_int(kr_amount.group(1))
+    amount = AMOUNT_PATTERN.search(text)
+    return to_int(amount.group(0)) if amount else None
+
+
+def parse_monthly(text: str | None) -> int | None:
+    # "129 kr./md." -> 129
+    if not text:
+        return None
+    match = MONTHLY_PATTERN.search(text)
+    return to_int(match.group(1)) if match else None
+
+
+def parse_min_cost(text: str | None) -> int | None:
+    # the amount after "Mindstepris": the first one marked as kroner ("Mindstepris inkl. 6 mdr. 2.299 kr.", not the
+    # 6), else the last one that isn't a number of months ("Mindstepris kr.: 2299")
+    if not text:
+        return None
+    match = MIN_COST_PATTERN.search(text)
+    if not match:
+        return None
+    rest = match.group(1)
+    kr_amount = KR_AMOUNT_PATTERN.search(rest)
+    if kr_amount:
+        return to_int(kr_amount.group(1))
+    amounts = NOT_MONTHS_PATTERN.findall(rest)
+    return to_int(amounts[-1]) if amounts else None
+
+
+def parse_promo(text: str | None) -> Promo | None:
+    if not text:
+        return None
+    match = PROMO_PATTERN.search(text)
+    if not match:
+        return None
+    return Promo(to_int(match.group(1)), int(match.group(2)), to_int(match.group(3)))
+
@@ -1,15 +1,18 @@
-import json
 import os
 import re
 import datetime
 import random
-import time
-from difflib import SequenceMatcher
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
+from playwright.sync_api import ViewportSize
 from playwright_stealth import Stealth
-from provider_sources import PROVIDER_SOURCES
-from scraper_utils import log, apply_name_substitutions
+from checkpoint import Checkpoint
+from market_lookup import run_lookups
+from market_price_cache import MarketPriceCache
+from price_parsing import parse_price
+from product_matching import capture_case, extract_storage, rank_candidates
+from provider_sources import ProductFeed, collect_product_names
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, log, apply_name_substitutions, write_json
 
 # setup
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,155 +34,6 @@ def clean_search_query(product_name):
     return name
 
 
-def normalize(text):
-    # lowercase, convert "+" to "plus", strip punctuation, collapse whitespace
-    text = text.lower()
-    text = re.sub(r'\+', ' plus ', text)
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-
-# tier words — if a candidate has one the query doesn't (or vice versa), it's a different product
-TIER_WORDS = {'ultra', 'cellular', 'aktiv støjreduktion', 'anc', 'plus', 'pro', 'max', 'mini', 'fe', 'fold', 'flip', 'lite', 'edge', 'air'}
-
-# accessory keywords — disqualify any candidate that is clearly not a device
-ACCESSORY_KEYWORDS = {
-    'case', 'cover', 'etui', 'skærmbeskyttelse', 'screen protector', 'beskyttelsesglas',
-    'oplader', 'charger', 'kabel', 'cable', 'rem', 'strap', 'sleeve',
-    'folie', 'glass', 'bumper', 'wallet', 'pung', 'holder', 'stand', 'dock',
-    'batteri', 'battery', 'ear', 'stylus', 'pen',
-    'loop', 'band', 'trail loop', 'alpine loop', 'milanese', 'sport loop',
-}
-
-
-def extract_storage(text):
-    # returns storage in GB as an int, or None
-    # skips RAM mentions like "12GB RAM" so only the storage figure is returned
-    cleaned = re.sub(r'\d+\s*GB\s*RAM', '', text, flags=re.IGNORECASE)
-    m = re.search(r'(\d+)\s*TB', cleaned, re.IGNORECASE)
-    if m:
-        return int(m.group(1)) * 1024
-    m = re.search(r'(\d+)\s*GB', cleaned, re.IGNORECASE)
-    if m:
-        return int(m.group(1))
-    return None
-
-
-def split_fused_tokens(text):
-    # split fused alpha+digit tokens so tier word checks work even when PriceRunner
-    # writes "Flip7" instead of "Flip 7" — e.g. "flip7" -> {"flip", "7", "flip7"}
-    text = normalize(text)
-    tokens = set()
-    for word in text.split():
-        parts = re.findall(r'[a-z]+|\d+', word)
-        tokens.update(parts)
-        tokens.add(word)
-    return tokens
-
-
-def extract_model_number(text):
-    # extract the primary model number for exact-match comparison e.g. "16e", "a36", "s25"
-    text = re.sub(r'\d+\s*GB\s*RAM', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\d+\s*(GB|TB)', '', text, flags=re.IGNORECASE)
-    noise = {'samsung', 'apple', 'google', 'motorola', 'oneplus', 'nothing', 'urbanista',
-             'galaxy', 'iphone', 'pixel', 'moto', 'nord', 'razr', 'leva',
-             '5g', '4g', 'lte', 'dual', 'sim', 'sm', 'smartphone', 'wireless',
-             'black', 'white', 'blue', 'green', 'grey', 'gray', 'silver', 'gold',
-             'sort', 'grå', 'hvid', 'obsidian', 'coral', 'red', 'jetblack',
-             'dark', 'true', 'on', 'ear', 'tws', 'gen', 'space black', 'wifi',
-             # tablet screen sizes — not model numbers
-             '10', '11', '12', '13', '14', '15', '16', '17', '18', '20', '24', '27'}
-    noise.update(TIER_WORDS)
-    tokens = normalize(text).split()
-    for token in tokens:
-        if token in noise:
-            continue
-        # must contain at least one digit to qualify as a model number
-        if re.search(r'\d', token):
-            return token
-    return None
-
-
-def score_match(query, candidate):
-    # returns a float 0–1, higher = better match
-
-    # disqualify accessories — cases, covers, cables, bands, etc.
-    candidate_lower = candidate.lower()
-    if any(kw in candidate_lower for kw in ACCESSORY_KEYWORDS):
-        return 0.0
-
-    q_tokens = split_fused_tokens(query)
-    c_tokens = split_fused_tokens(candidate)
-
-    # disqualify if either side has a tier word the other is missing
-    for word in TIER_WORDS:
-        if word in c_tokens and word not in q_tokens:
-            return 0.0
-        if word in q_tokens and word not in c_tokens:
-            return 0.0
-
-    # disqualify if both sides specify storage but it differs
-    q_storage = extract_storage(query)
-    c_storage = extract_storage(candidate)
-    if q_storage is not None and c_storage is not None and q_storage != c_storage:
-        return 0.0
-
-    # disqualify if model numbers differ e.g. "iPhone 16" vs "iPhone 16e"
-    q_model = extract_model_number(query)
-    c_model = extract_model_number(candidate)
-    if q_model and c_model and q_model != c_model:
-        q_parts = set(re.findall(r'[a-z]+|\d+', q_model))
-        c_parts = set(re.findall(r'[a-z]+|\d+', c_model))
-        q_digits = {p for p in q_parts if p.isdigit()}
-        c_digits = {p for p in c_parts if p.isdigit()}
-        q_alpha = q_parts - q_digits
-        c_alpha = c_parts - c_digits
-        if q_digits == c_digits and q_alpha == c_alpha:
-            pass
-        elif q_digits == c_digits and (not q_alpha or not c_alpha):
-            extra_alpha = q_alpha or c_alpha
-            if extra_alpha.issubset(TIER_WORDS):
-                pass
-            else:
-                return 0.0
-        else:
-            return 0.0
-
-    # disqualify if the candidate has extra bare numeric tokens the query doesn't have
-    # e.g. "Motorola Edge 60 12 512GB" has a bare "12" (unlabelled RAM) absent from the query
-    def _non_storage_digits(text, storage, model):
-        storage_str = str(storage) if storage else None
-        model_digits = set(re.findall(r'\d+', model)) if model else set()
-        result = set()
-        for tok in normalize(text).split():
-            if not tok.isdigit():
-                continue
-            if storage_str and tok == storage_str:
-                continue
-            if tok in model_digits:
-                continue
-            result.add(tok)
-        return result
-
-    q_extra_digits = _non_storage_digits(query, q_storage, q_model)
-    c_extra_digits = _non_storage_digits(candidate, c_storage, c_model)
-    if c_extra_digits - q_extra_digits:
-        return 0.0
-
-    return SequenceMatcher(None, normalize(query), normalize(candidate)).ratio()
-
-
-def parse_price_text(price_text):
-    # convert e.g. "10.899,00 kr." -> 10899
-    if not price_text:
-        return None
-    price_clean = re.sub(r'\.(?=\d{3}(\D|$))', '', price_text)  # strip thousands dots
-    price_clean = re.sub(r',\d+', '', price_clean)                # strip decimal fraction
-    digits = "".join(re.findall(r'\d+', price_clean))
-    return int(digits) if digits else None
-
-
 def get_market_price(page, product_name):
 
     query = clean_search_query(product_name).replace(' ', '+')
@@ -190,14 +44,14 @@ def get_market_price(page, product_name):
         page.wait_for_timeout(random.uniform(2000, 3500))
     except Exception:
         log(f"Could not load page for: {product_name}")
-        return None, False
+        return None, False, None, None
 
     # each product card is an <a> with a title attribute and href starting with "/pl/"
     card_links = page.query_selector_all('a[href^="/pl/"][title]')
 
     if not card_links:
         log(f"No product cards found")
-        return None, True
+        return None, True, None, None
 
     # collect (title, price_text) for every card
     candidates = []
@@ -233,26 +87,26 @@ def get_market_price(page, product_name):
 
     if not candidates:
         log(f"Could not extract any prices")
-        return None, True
+        return None, True, None, None
 
     query_clean = clean_search_query(product_name)
     q_has_storage = extract_storage(query_clean) is not None
 
-    # score and sort candidates — highest score first
-    scored = [(score_match(query_clean, title), title, price_text)
-              for title, price_text in candidates]
-    scored = [s for s in scored if s[0] > 0.0]
+    # score and sort candidates — highest score first, disqualified ones dropped
+    titles = [title for title, _ in candidates]
+    ranked = rank_candidates(query_clean, titles)
+    capture_case(query_clean, titles, ranked)
+    scored = [(score, *candidates[i]) for score, i in ranked]
 
     if not scored:
         log(f"All candidates disqualified")
-        return None, True
+        return None, True, None, None
 
-    scored.sort(key=lambda x: x[0], reverse=True)
     best_score = scored[0][0]
 
     if best_score < 0.4:
         log(f"Best score {best_score:.2f} below threshold, skipping")
-        return None, True
+        return None, True, None, None
 
     # keep candidates within 15% of the best score — wide enough for storage/colour variants to all be included
     top_candidates = [s for s in scored if s[0] >= best_score * 0.85]
@@ -261,12 +115,12 @@ def get_market_price(page, product_name):
         # for exact storage queries, choose the cheapest among top score matches
         priced_top = []
         for score, title, price_text in top_candidates:
-            parsed = parse_price_text(price_text)
+            parsed = parse_price(price_text)
             if parsed is not None:
                 priced_top.append((score, title, price_text, parsed))
         if not priced_top:
             log("No parseable prices among top candidates")
-            return None, True
+            return None, True, None, None
         priced_top.sort(key=lambda x: (x[3], -x[0]))
         best_score, best_title, best_price_text, best_price = priced_top[0]
     else:
@@ -281,18 +135,18 @@ def get_market_price(page, product_name):
         storage_group = [item for item in top_candidates if storage_sort_key(item) == min_storage]
         priced_group = []
         for score, title, price_text in storage_group:
-            parsed = parse_price_text(price_text)
+            parsed = parse_price(price_text)
             if parsed is not None:
                 priced_group.append((score, title, price_text, parsed))
         if not priced_group:
             log("No parseable prices in preferred storage group")
-            return None, True
+            return None, True, None, None
         priced_group.sort(key=lambda x: (x[3], -x[0]))
         best_score, best_title, best_price_text, best_price = priced_group[0]
 
     log(f"Matched: '{best_title}' (score={best_score:.2f})")
 
-    return best_price, True
+    return best_price, True, best_title, best_score
 
 
 def make_fresh_page(browser):
@@ -314,6 +168,8 @@ def make_fresh_page(browser):
             "%a+%b+%d+%Y+%H%%3A%M%%3A%S+GMT%%2B0100") + "&version=202209.1.0&isIABGlobal=false&hosts=&consentId=pricerunner-consent&interactionCount=1&landingPath=NotLandingPage&groups=C0001%%3A1%%2CC0002%%3A1%%2CC0003%%3A1%%2CC0004%%3A1",
          "domain": ".pricerunner.dk", "path": "/"},
     ])
+    # their own scripts stay, so the session still looks like an ordinary visit
+    block_unneeded_requests(context, "pricerunner", block_trackers=False)
     page = context.new_page()
     Stealth().use_sync(page)
     try:
@@ -339,77 +195,44 @@ def make_fresh_page(browser):
     return context, page
 
 
-def scrape_pricerunner():
+def scrape_pricerunner(browser=None, products=None):
     (BASE_DIR / 'data' / 'pricerunner').mkdir(parents=True, exist_ok=True)
 
-    # collect unique product names from all provider files
-    products = []
-    for path, name_field in PROVIDER_SOURCES:
-        full_path = BASE_DIR / path
-        if full_path.exists():
-            with full_path.open(encoding='utf-8') as f:
-                offers = json.load(f)
-            for offer in offers:
-                name = offer.get(name_field, '')
-                if not name and name_field == 'product_name':
-                    name = offer.get('product', '')
-                if name:
-                    products.append(name)
-
-    products = list(set(products))
-
-    results = {}
-    date_time = datetime.datetime.now().strftime("%d-%m-%Y-%H:%M")
-
-    failure_threshold = 3
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
+    # names either stream in from the orchestrator as each provider file lands, or are read from disk up front
+    if products is None:
+        products = collect_product_names()
+
+    cache = MarketPriceCache(BASE_DIR / 'data' / 'pricerunner' / 'pricerunner_cache.json')
+    # lookups a crashed run already finished
+    journal = Checkpoint("pricerunner")
+    if isinstance(products, ProductFeed) and products.closed:
+        # every provider has already finished, so the whole list is known up front
+        products = list(products)
+    # back up check for name substitutions, applied lazily so a streaming feed keeps streaming
+    if isinstance(products, list):
+        # stale lookups go first so a run that dies halfway has refreshed the oldest prices
+        products = cache.prioritize([apply_name_substitutions(name) for name in products], clean_search_query)
+    else:
+        products = cache.prioritize_stream((apply_name_substitutions(name) for name in products), clean_search_query)
+
+    with browser_session(browser, headless=is_ci) as browser:
+        results, looked_up, from_cache = run_lookups(
+            products,
+            browser=browser,
+            domain="pricerunner.dk",
+            cache=cache,
+            make_fresh_page=make_fresh_page,
+            get_market_price=get_market_price,
+            clean_search_query=clean_search_query,
             headless=is_ci,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-            ]
+            checkpoint=journal,
         )
-        context, page = make_fresh_page(browser)
-        consecutive_failures = 0
-
-        for product_name in products:
-            product_name = apply_name_substitutions(product_name) # back up check for name substitutions
-            log(f"Looking up: {product_name}")
-            price, page_loaded = get_market_price(page, product_name)
-
-            if not page_loaded:
-                consecutive_failures += 1
-                log(f"  [failure {consecutive_failures}/{failure_threshold}]")
-
-                if consecutive_failures >= failure_threshold:
-                    # recycle the browser context to recover from a potential block
-                    log(f"\n  !! {failure_threshold} consecutive failures — recycling browser context and pausing 10s...\n")
-                    context.close()
-                    time.sleep(10)
-                    context, page = make_fresh_page(browser)
-                    consecutive_failures = 0
-
-                    log(f"  Retrying: {product_name}")
-                    price, page_loaded = get_market_price(page, product_name)
-            else:
-                consecutive_failures = 0
-
-            results[product_name] = {
-                "market_price": price,
-                "looked_up_at": date_time
-            }
-            log(f"  -> {price} kr.")
-
-        context.close()
-        browser.close()
-
-    with (BASE_DIR / 'data' / 'pricerunner' / 'pricerunner_prices.json').open('w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=4)
-
-    log(f"\nLooked up {len(results)} products.")
+
+    cache.save()
+    write_json(BASE_DIR / 'data' / 'pricerunner' / 'pricerunner_prices.json', results)
+    journal.finish()
+
+    log(f"\nLooked up {looked_up} products, {from_cache} served from cache.")
 
 
 if __name__ == "__main__":
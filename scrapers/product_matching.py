@@ -0,0 +1,285 @@
+import json
+import os
+import re
+import threading
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+# shared matching engine for the market-price scrapers (PriceRunner and Prisjagt). every pattern is compiled once
+# and the features of a string (query or candidate title) are computed once and memoized, so scoring a results
+# page only does set comparisons plus one similarity ratio per candidate
+
+# tier words — if a candidate has one the query doesn't (or vice versa), it's a different product
+TIER_WORDS = frozenset({
+    'ultra', 'cellular', 'aktiv støjreduktion', 'anc', 'plus', 'pro', 'max', 'mini', 'fe', 'fold', 'flip', 'lite',
+    'edge', 'air',
+})
+
+# accessory keywords — disqualify any candidate that is clearly not a device
+ACCESSORY_KEYWORDS = (
+    'case', 'cover', 'etui', 'skærmbeskyttelse', 'screen protector', 'beskyttelsesglas',
+    'oplader', 'charger', 'kabel', 'cable', 'rem', 'strap', 'sleeve',
+    'folie', 'glass', 'bumper', 'wallet', 'pung', 'holder', 'stand', 'dock',
+    'batteri', 'battery', 'ear', 'stylus', 'pen',
+    'loop', 'band', 'trail loop', 'alpine loop', 'milanese', 'sport loop',
+)
+
+# tokens that are never the model number: brands, series, colours and connectivity
+MODEL_NOISE = frozenset({
+    'samsung', 'apple', 'google', 'motorola', 'oneplus', 'nothing', 'urbanista',
+    'galaxy', 'iphone', 'pixel', 'moto', 'nord', 'razr', 'leva',
+    '5g', '4g', 'lte', 'dual', 'sim', 'sm', 'smartphone', 'wireless',
+    'black', 'white', 'blue', 'green', 'grey', 'gray', 'silver', 'gold',
+    'sort', 'grå', 'hvid', 'obsidian', 'coral', 'red', 'jetblack',
+    'dark', 'true', 'on', 'ear', 'tws', 'gen', 'wifi',
+    'space', 'cosmic', 'ocean', 'starlight', 'midnight', 'sunrise',
+    'grisaille', 'navy', 'silhouette', 'moonstone', 'graphite', 'blueblack',
+}) | TIER_WORDS
+
+# tablet screen sizes — not model numbers, but only on a tablet: on a phone a bare "16" is the model
+SCREEN_SIZES = frozenset({'10', '11', '12', '13', '14', '15', '16', '17', '18', '20', '24', '27'})
+_TABLET = re.compile(r'\b(ipad|tab|tablet|pad)\b')
+
+_PLUS = re.compile(r'\+')
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+_RAM = re.compile(r'\d+\s*GB\s*RAM', re.IGNORECASE)
+_STORAGE_TB = re.compile(r'(\d+)\s*TB', re.IGNORECASE)
+_STORAGE_GB = re.compile(r'(\d+)\s*GB', re.IGNORECASE)
+_STORAGE_ANY = re.compile(r'\d+\s*(GB|TB)', re.IGNORECASE)
+_ALPHA_OR_DIGITS = re.compile(r'[a-z]+|\d+')
+_DIGITS = re.compile(r'\d+')
+_HAS_DIGIT = re.compile(r'\d')
+_ACCESSORY = re.compile('|'.join(re.escape(kw) for kw in ACCESSORY_KEYWORDS))
+
+# below this score no candidate is considered a match
+MATCH_THRESHOLD = 0.4
+# candidates within this fraction of the best score are all acceptable picks (storage/colour variants)
+TOP_CANDIDATE_RATIO = 0.85
+
+# similarity backend used once a candidate survives every disqualification check, see SIMILARITY_BACKENDS.
+# MATCH_THRESHOLD and TOP_CANDIDATE_RATIO were calibrated on sequence_matcher scores, so another backend stays opt-in
+# until match_benchmark.py shows it picks the same listings through those thresholds
+SIMILARITY_BACKEND = os.environ.get("MATCH_SIMILARITY", "sequence_matcher")
+
+# when set, every ranked results page is appended here as a regression case for match_benchmark.py
+MATCH_CORPUS_PATH = os.environ.get("MATCH_CORPUS_PATH")
+_corpus_lock = threading.Lock()
+
+
+def normalize(text: str) -> str:
+    # lowercase, convert "+" to "plus", strip punctuation, collapse whitespace
+    text = text.lower()
+    text = _PLUS.sub(' plus ', text)
+    text = _PUNCTUATION.sub(' ', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def extract_storage(text: str) -> int | None:
+    # returns storage in GB as an int, or None
+    # skips RAM mentions like "12GB RAM" so only the storage figure is returned
+    return features(text).storage
+
+
+def _extract_storage(text: str) -> int | None:
+    cleaned = _RAM.sub('', text)
+    m = _STORAGE_TB.search(cleaned)
+    if m:
+        return int(m.group(1)) * 1024
+    m = _STORAGE_GB.search(cleaned)
+    if m:
+        return int(m.group(1))
+    return None
+
+
+def split_fused_tokens(normalized: str) -> frozenset[str]:
+    # split fused alpha+digit tokens so tier word checks work even when a site writes "Flip7" instead of
+    # "Flip 7" — e.g. "flip7" -> {"flip", "7", "flip7"}. expects already-normalized text
+    tokens = set()
+    for word in normalized.split():
+        tokens.update(_ALPHA_OR_DIGITS.findall(word))
+        tokens.add(word)
+    return frozenset(tokens)
+
+
+def extract_model_number(text: str, *, tablet: bool = False) -> str | None:
+    # extract the primary model number for exact-match comparison e.g. "16e", "a36", "s25"
+    text = _RAM.sub('', text)
+    text = _STORAGE_ANY.sub('', text)
+    for token in normalize(text).split():
+        if token in MODEL_NOISE or (tablet and token in SCREEN_SIZES):
+            continue
+        # must contain at least one digit to qualify as a model number
+        if _HAS_DIGIT.search(token):
+            return token
+    return None
+
+
+class MatchFeatures(NamedTuple):
+    normalized: str
+    tiers: frozenset[str]
+    storage: int | None
+    model: str | None
+    model_digits: frozenset[str]
+    model_alpha: frozenset[str]
+    extra_digits: frozenset[str]
+    is_accessory: bool
+    tablet: bool
+
+
+@lru_cache(maxsize=8192)
+def features(text: str, tablet: bool | None = None) -> MatchFeatures:
+    # everything score_match needs to know about one side of a comparison, memoized by the raw string.
+    # tablet decides whether bare screen sizes are skipped when picking the model number; a candidate is read
+    # the way its query is (score_match passes the query's), and None means "look at the text itself"
+    normalized = normalize(text)
+    if tablet is None:
+        tablet = _TABLET.search(normalized) is not None
+    storage = _extract_storage(text)
+    model = extract_model_number(text, tablet=tablet)
+
+    model_parts = set(_ALPHA_OR_DIGITS.findall(model)) if model else set()
+    model_digits = frozenset(p for p in model_parts if p.isdigit())
+
+    # bare numeric tokens that are neither the storage figure nor part of the model number,
+    # e.g. the unlabelled RAM "12" in "Motorola Edge 60 12 512GB"
+    storage_str = str(storage) if storage else None
+    model_number_digits = set(_DIGITS.findall(model)) if model else set()
+    extra_digits = frozenset(
+        tok for tok in normalized.split()
+        if tok.isdigit() and tok != storage_str and tok not in model_number_digits
+    )
+
+    return MatchFeatures(
+        normalized=normalized,
+        tiers=TIER_WORDS & split_fused_tokens(normalized),
+        storage=storage,
+        model=model,
+        model_digits=model_digits,
+        model_alpha=frozenset(model_parts - model_digits),
+        extra_digits=extra_digits,
+        is_accessory=_ACCESSORY.search(text.lower()) is not None,
+        tablet=tablet,
+    )
+
+
+def sequence_matcher_ratio(a: str, b: str) -> float:
+    # difflib's ratio: 2*M/T over matching blocks. the original scorer, kept as the reference and fallback
+    return SequenceMatcher(None, a, b).ratio()
+
+
+@lru_cache(maxsize=8192)
+def _char_masks(text: str) -> dict[str, int]:
+    # bit i of masks[ch] is set when text[i] == ch
+    masks: dict[str, int] = {}
+    for i, ch in enumerate(text):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    return masks
+
+
+def lcs_ratio(a: str, b: str) -> float:
+    # 2*LCS/T, the same scale as SequenceMatcher.ratio() but from the true longest common subsequence,
+    # computed bit-parallel (Hyyrö) with one big-int update per character of b instead of a block search
+    total = len(a) + len(b)
+    if not total:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    masks = _char_masks(a)
+    full = (1 << len(a)) - 1
+    v = full
+    for ch in b:
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+    lcs = len(a) - v.bit_count()
+    return 2 * lcs / total
+
+
+def token_set_ratio(a: str, b: str) -> float:
+    # dice coefficient over the word sets — ignores word order and repeats entirely
+    ta, tb = set(a.split()), set(b.split())
+    if not ta and not tb:
+        return 1.0
+    return 2 * len(ta & tb) / (len(ta) + len(tb))
+
+
+# every backend takes two normalized strings and returns 0-1
+SIMILARITY_BACKENDS: dict[str, Callable[[str, str], float]] = {
+    "lcs": lcs_ratio,
+    "sequence_matcher": sequence_matcher_ratio,
+    "token_set": token_set_ratio,
+}
+_similarity = SIMILARITY_BACKENDS.get(SIMILARITY_BACKEND, sequence_matcher_ratio)
+
+
+def set_similarity_backend(name: str) -> None:
+    global _similarity
+    _similarity = SIMILARITY_BACKENDS[name]
+
+
+def score_features(q: MatchFeatures, c: MatchFeatures) -> float:
+    # returns a float 0–1, higher = better match
+
+    # disqualify accessories — cases, covers, cables, bands, etc.
+    if c.is_accessory:
+        return 0.0
+
+    # disqualify if either side has a tier word the other is missing
+    if q.tiers != c.tiers:
+        return 0.0
+
+    # disqualify if both sides specify storage but it differs
+    if q.storage is not None and c.storage is not None and q.storage != c.storage:
+        return 0.0
+
+    # disqualify if model numbers differ e.g. "iPhone 16" vs "iPhone 16e"
+    if q.model and c.model and q.model != c.model:
+        if q.model_digits != c.model_digits:
+            return 0.0
+        if q.model_alpha != c.model_alpha:
+            # a suffix on only one side is allowed when it's a tier word
+            if q.model_alpha and c.model_alpha:
+                return 0.0
+            if not (q.model_alpha or c.model_alpha).issubset(TIER_WORDS):
+                return 0.0
+
+    # disqualify if the candidate has extra bare numeric tokens the query doesn't have
+    if c.extra_digits - q.extra_digits:
+        return 0.0
+
+    return _similarity(q.normalized, c.normalized)
+
+
+def clear_caches() -> None:
+    # forget every memoized string, e.g. to time a cold run
+    features.cache_clear()
+    _char_masks.cache_clear()
+
+
+def score_match(query: str, candidate: str) -> float:
+    q = features(query)
+    return score_features(q, features(candidate, q.tablet))
+
+
+def rank_candidates(query: str, titles: list[str]) -> list[tuple[float, int]]:
+    # score every candidate title against one query. returns (score, index into titles) for the candidates
+    # that weren't disqualified, best first; ties keep their order on the results page
+    q = features(query)
+    scored = [(score_features(q, features(title, q.tablet)), i) for i, title in enumerate(titles)]
+    scored = [s for s in scored if s[0] > 0.0]
+    scored.sort(key=lambda s: s[0], reverse=True)
+    return scored
+
+
+def capture_case(query: str, titles: list[str], ranked: list[tuple[float, int]]) -> None:
+    # append one (query, candidates, expected) case to MATCH_CORPUS_PATH; the expected picks are today's top
+    # candidates, so review captured cases by hand before trusting them as ground truth
+    if not MATCH_CORPUS_PATH or not titles:
+        return
+    expected = []
+    if ranked and ranked[0][0] >= MATCH_THRESHOLD:
+        expected = [titles[i] for score, i in ranked if score >= ranked[0][0] * TOP_CANDIDATE_RATIO]
+    line = json.dumps({"query": query, "candidates": titles, "expected": expected}, ensure_ascii=False)
+    with _corpus_lock, open(MATCH_CORPUS_PATH, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
@@ -1,3 +1,11 @@
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 PROVIDER_SOURCES = [
     ("data/telmore/telmore_offers.json", "product_name"),
     ("data/telmore/telmore_tilgift_offers.json", "product_name"),
@@ -10,3 +18,68 @@ PROVIDER_SOURCES = [
     ("data/callme/callme_offers.json", "product_name"),
 ]
 
+
+def read_product_names(path: str, name_field: str) -> list[str]:
+    # product names from one provider file, or nothing if the provider hasn't produced a file yet
+    full_path = BASE_DIR / path
+    if not full_path.exists():
+        return []
+    with full_path.open(encoding='utf-8') as f:
+        offers = json.load(f)
+
+    names = []
+    for offer in offers:
+        name = offer.get(name_field, '')
+        if not name and name_field == 'product_name':
+            name = offer.get('product', '')
+        if name:
+            names.append(name)
+    return names
+
+
+def collect_product_names() -> list[str]:
+    # unique product names across every provider file currently on disk
+    names: set[str] = set()
+    for path, name_field in PROVIDER_SOURCES:
+        names.update(read_product_names(path, name_field))
+    return list(names)
+
+
+_END = object()
+
+
+class ProductFeed:
+    # thread-safe stream of unique product names. the orchestrator publishes each provider's names as soon as
+    # its file is written and closes the feed once every provider is done; a market-price scraper simply
+    # iterates it, blocking until the next name arrives
+
+    def __init__(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._seen: set[str] = set()
+        self._lock = threading.Lock()
+        # once closed, iterating yields every name there will be without blocking
+        self.closed = False
+
+    def publish(self, names: Iterable[str]) -> int:
+        added = 0
+        with self._lock:
+            for name in names:
+                if name and name not in self._seen:
+                    self._seen.add(name)
+                    self._queue.put(name)
+                    added += 1
+        return added
+
+    def publish_file(self, path: str, name_field: str) -> int:
+        return self.publish(read_product_names(path, name_field))
+
+    def close(self) -> None:
+        self.closed = True
+        self._queue.put(_END)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            name = self._queue.get()
+            if name is _END:
+                return
+            yield name
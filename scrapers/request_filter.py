@@ -0,0 +1,99 @@
+import os
+import threading
+from urllib.parse import urlsplit
+from scraper_utils import log
+
+# the scrapers only read the DOM and the JSON the pages fetch. product images are downloaded separately from their
+# src attribute (download_image_cached), so the browser never has to load them itself
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# analytics and ad hosts. consent managers (Cookie Information, OneTrust, Cookiebot) are deliberately not listed —
+# some scrapers click their banners
+TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "facebook.com", "hotjar.com", "clarity.ms", "bat.bing.com",
+    "analytics.tiktok.com", "snap.licdn.com", "px.ads.linkedin.com", "ct.pinterest.com", "criteo.com",
+    "criteo.net", "adform.net", "taboola.com", "siteimproveanalytics.com", "nr-data.net", "sleeknote.com",
+    "trustpilot.com",
+)
+
+# SCRAPER_BLOCK_REQUESTS=0 lets everything through but still reports what would have been blocked and its size,
+# which is the way to measure what blocking saves
+BLOCK_REQUESTS = os.environ.get("SCRAPER_BLOCK_REQUESTS", "1") != "0"
+
+
+def _is_tracker(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    return any(host == domain or host.endswith("." + domain) for domain in TRACKER_DOMAINS)
+
+
+class RequestFilter:
+    # aborts images, media, fonts and tracker requests on one browser context. URLs containing any of the `allow`
+    # substrings (e.g. an intercepted JSON API) always go through
+
+    def __init__(self, name: str, *, allow: tuple[str, ...] = (), blocked_types: frozenset[str] = BLOCKED_RESOURCE_TYPES,
+                 block_trackers: bool = True, enabled: bool = BLOCK_REQUESTS):
+        self.name = name
+        self.allow = allow
+        self.blocked_types = blocked_types
+        self.block_trackers = block_trackers
+        self.enabled = enabled
+        self.blocked: dict[str, int] = {}
+        self.blocked_bytes = 0
+        self.loaded_bytes = 0
+        self._lock = threading.Lock()
+
+    def category(self, request) -> str | None:
+        # why this request would be blocked, or None if it is needed
+        url = request.url
+        if any(pattern in url for pattern in self.allow):
+            return None
+        if self.block_trackers and _is_tracker(url):
+            return "tracker"
+        if request.resource_type in self.blocked_types:
+            return request.resource_type
+        return None
+
+    def install(self, context) -> None:
+        context.on("response", self._on_response)
+        context.on("close", lambda _: log(self.summary()))
+        if self.enabled:
+            context.route("**/*", self._handle_route)
+
+    def _handle_route(self, route) -> None:
+        category = self.category(route.request)
+        if category is None:
+            route.fallback()
+            return
+        with self._lock:
+            self.blocked[category] = self.blocked.get(category, 0) + 1
+        route.abort("blockedbyclient")
+
+    def _on_response(self, response) -> None:
+        # content-length is the transferred (compressed) size; chunked responses without one count as 0
+        try:
+            size = int(response.headers.get("content-length", 0))
+        except ValueError:
+            size = 0
+        category = self.category(response.request)
+        with self._lock:
+            if category is None:
+                self.loaded_bytes += size
+            else:
+                # only reachable with blocking disabled
+                self.blocked[category] = self.blocked.get(category, 0) + 1
+                self.blocked_bytes += size
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{count} {category}" for category, count in sorted(self.blocked.items())) or "nothing"
+        loaded = f"{self.loaded_bytes / 1_000_000:.1f} MB loaded"
+        if self.enabled:
+            return f"Request filter ({self.name}): blocked {counts}; {loaded}"
+        return (f"Request filter ({self.name}, not blocking): would have blocked {counts} "
+                f"saving {self.blocked_bytes / 1_000_000:.1f} MB; {loaded}")
+
+
+def block_unneeded_requests(context, name: str, **kwargs) -> RequestFilter:
+    request_filter = RequestFilter(name, **kwargs)
+    request_filter.install(context)
+    return request_filter
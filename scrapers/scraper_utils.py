@@ -2,10 +2,22 @@ import datetime
 import json
 import re
 import builtins
+import functools
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from playwright.sync_api import Browser, sync_playwright
+
+from image_processing import to_webp
 
 # manual substitutions for product names that are too inconsistent to reliably parse price data from. the keys are regex
 # patterns that are applied to the raw product name, and the values are the normalized product names that are used for
@@ -47,28 +59,182 @@ PRODUCT_NAME_SUBSTITUTIONS = {
     "Samsung Galaxy Watch8 40mm eSIM - Grafit": "Samsung Galaxy Watch8 40mm LTE",
 }
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# more substitutions in the same {pattern: replacement} form, so the table can grow without a code change. an entry
+# here overrides the built-in one with the same pattern
+NAME_SUBSTITUTIONS_PATH = Path(os.environ.get("NAME_SUBSTITUTIONS_PATH",
+                                              BASE_DIR / "data" / "product_name_substitutions.json"))
+
+
+@functools.cache
+def _name_substitutions() -> tuple[re.Pattern, list[str]]:
+    # every pattern as one named alternative, so a name is scanned once however long the table gets. as with a
+    # re.sub per pattern, every occurrence is replaced; replacements are taken literally
+    table = dict(PRODUCT_NAME_SUBSTITUTIONS)
+    if NAME_SUBSTITUTIONS_PATH.exists():
+        with NAME_SUBSTITUTIONS_PATH.open(encoding="utf-8") as f:
+            table.update(json.load(f))
+    alternatives = "|".join(f"(?P<s{i}>{pattern})" for i, pattern in enumerate(table)) or "(?!)"
+    return re.compile(alternatives, re.IGNORECASE), list(table.values())
+
+
 # apply manual substitution
+@functools.lru_cache(maxsize=4096)
 def apply_name_substitutions(product_name):
-    import re
     if not product_name:
         return product_name
 
-    result = product_name
-    for pattern, replacement in PRODUCT_NAME_SUBSTITUTIONS.items():
-        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
+    pattern, replacements = _name_substitutions()
+    return pattern.sub(lambda m: replacements[int(m.lastgroup[1:])], product_name).strip()
+
+
+
+# launch flags shared by every scraper so a single Chromium instance can serve all of them
+CHROMIUM_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",
+]
+
+
+@contextmanager
+def browser_session(browser: Browser | None = None, *, headless: bool = True) -> Iterator[Browser]:
+    # reuse a browser handed in by the orchestrator, or launch a private one when a scraper runs standalone.
+    # only a browser launched here is closed here — callers should close their own contexts
+    if browser is not None:
+        yield browser
+        return
 
-    return result.strip()
+    with sync_playwright() as p:
+        launched = p.chromium.launch(headless=headless, args=CHROMIUM_ARGS)
+        try:
+            yield launched
+        finally:
+            launched.close()
 
 
+# what the browser contexts identify as, for plain HTTP clients talking to the same sites
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def http_session(*, pool_size: int = 8, retries: int = 2) -> requests.Session:
+    # keep-alive connection pool with retries on transient errors, for scrapers that talk to JSON APIs directly
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
 
 def now_timestamp() -> str:
     return datetime.datetime.now().strftime("%d-%m-%Y-%H:%M")
 
 
-def write_json(path: Path, data: Any) -> None:
+def _json_text(data: Any, compact: bool) -> str:
+    # indented for the files people read and diff, compact for the ones only the scrapers read back
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=4)
+
+
+def _partial_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+
+
+def _commit_partial(partial_path: Path, path: Path) -> bool:
+    # move a fully written and fsynced temp file over `path`, or drop it when the content is byte-identical so an
+    # unchanged file keeps its mtime and never shows up in the data commit. returns whether `path` changed
+    try:
+        unchanged = path.stat().st_size == partial_path.stat().st_size and path.read_bytes() == partial_path.read_bytes()
+    except FileNotFoundError:
+        unchanged = False
+    if unchanged:
+        partial_path.unlink()
+        return False
+    partial_path.replace(path)
+    return True
+
+
+def write_json(path: Path, data: Any, *, compact: bool = False) -> bool:
+    # atomic: readers see either the old file or the new one, never a truncated one. returns whether it changed
+    content = _json_text(_settle_images(data), compact).encode("utf-8")
+    try:
+        if path.read_bytes() == content:
+            return False
+    except FileNotFoundError:
+        pass
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    partial_path = _partial_path(path)
+    try:
+        with partial_path.open("wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        partial_path.replace(path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return True
+
+
+class JsonArrayWriter:
+    # a JSON array written entry by entry as the scraper produces them, laid out exactly like write_json's. an entry
+    # whose images are still downloading is held back (with everything after it, to keep the order) until they land,
+    # so streaming never stalls the download pool. use through json_array_writer
+    def __init__(self, f, compact: bool) -> None:
+        self._f = f
+        self._compact = compact
+        self._held: list[Any] = []
+        self.count = 0
+
+    def append(self, entry: Any) -> None:
+        self._held.append(entry)
+        while self._held and _images_ready(self._held[0]):
+            self._write(self._held.pop(0))
+
+    def _write(self, entry: Any) -> None:
+        text = _json_text(_settle_images(entry, save_manifest=False), self._compact)
+        if self._compact:
+            self._f.write(("," if self.count else "") + text)
+        else:
+            self._f.write((",\n" if self.count else "\n") + "\n".join(f"    {line}" for line in text.split("\n")))
+        self.count += 1
+
+    def _finish(self) -> None:
+        for entry in self._held:
+            self._write(entry)
+        self._held.clear()
+        self._f.write("\n]" if self.count and not self._compact else "]")
+        _save_manifest()
+
+
+@contextmanager
+def json_array_writer(path: Path, *, compact: bool = False) -> Iterator[JsonArrayWriter]:
+    # with json_array_writer(OUTPUT_PATH) as out: out.append(entry)
+    # entries go to a temp file as they come; it replaces `path` only once the block finishes without raising
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = _partial_path(path)
+    try:
+        with partial_path.open("w", encoding="utf-8") as f:
+            f.write("[")
+            writer = JsonArrayWriter(f, compact)
+            yield writer
+            writer._finish()
+            f.flush()
+            os.fsync(f.fileno())
+        _commit_partial(partial_path, path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
 
 
 def _normalize_image_url(image_url: str, base_url: str | None) -> str:
@@ -79,23 +245,54 @@ def _normalize_image_url(image_url: str, base_url: str | None) -> str:
     return image_url
 
 
+# politeness caps shared by everything in the process that talks to the same site from several threads
+_domain_slots: dict[str, threading.BoundedSemaphore] = {}
+_domain_slots_lock = threading.Lock()
+
+
+def domain_slot(domain: str, limit: int) -> threading.BoundedSemaphore:
+    # the first caller for a domain sets its limit
+    with _domain_slots_lock:
+        if domain not in _domain_slots:
+            _domain_slots[domain] = threading.BoundedSemaphore(limit)
+        return _domain_slots[domain]
+
+
+# per-thread log prefix so interleaved output from scrapers running in parallel stays readable
+_log_scope = threading.local()
+
+
+@contextmanager
+def log_scope(name: str) -> Iterator[None]:
+    previous = getattr(_log_scope, "prefix", "")
+    _log_scope.prefix = f"[{name}] "
+    try:
+        yield
+    finally:
+        _log_scope.prefix = previous
+
+
+def _prefix() -> str:
+    return getattr(_log_scope, "prefix", "")
+
+
 def log(*args: Any, sep: str = " ", end: str = "\n") -> None:
     message = sep.join(str(a) for a in args)
     leading_newlines = len(message) - len(message.lstrip("\n"))
     stripped = message.lstrip("\n")
     if not stripped.startswith("["):
         stripped = f"{stripped}"
-    builtins.print(("\n" * leading_newlines) + stripped, end=end)
+    builtins.print(("\n" * leading_newlines) + _prefix() + stripped, end=end)
 
 
 def warn(*args: Any, sep: str = " ", end: str = "\n") -> None:
     message = sep.join(str(a) for a in args)
-    builtins.print(f"[WARN] {message.lstrip()}", end=end)
+    builtins.print(f"{_prefix()}[WARN] {message.lstrip()}", end=end)
 
 
 def error(*args: Any, sep: str = " ", end: str = "\n") -> None:
     message = sep.join(str(a) for a in args)
-    builtins.print(f"[ERROR] {message.lstrip()}", end=end)
+    builtins.print(f"{_prefix()}[ERROR] {message.lstrip()}", end=end)
 
 
 def offer_summary(
@@ -117,6 +314,45 @@ def offer_summary(
     )
 
 
+# images are downloaded in the background so scraping never waits on them: download_image_cached returns a path
+# straight away, and write_json waits for the downloads whose paths appear in the data it writes
+IMAGE_DOWNLOAD_WORKERS = int(os.environ.get("IMAGE_DOWNLOAD_WORKERS", "8"))
+IMAGE_DOWNLOADS_PER_HOST = int(os.environ.get("IMAGE_DOWNLOADS_PER_HOST", "4"))
+
+# every distinct image is stored once, named by a hash of its bytes. the manifest maps each product's name path
+# (/images/<provider>/<name>.webp, what download_image_cached used to save to) to the URL it was fetched from, the
+# stored image and the response's validators. a different URL is always fetched; the same URL is revalidated with a
+# conditional request once the entry is older than IMAGE_REVALIDATE_DAYS, which mostly costs a 304
+PUBLIC_DIR = BASE_DIR / "public"
+IMAGE_ROOT = PUBLIC_DIR / "images"
+IMAGE_STORE_DIR = IMAGE_ROOT / "store"
+IMAGE_STORE_PREFIX = "/images/store"
+IMAGE_MANIFEST_PATH = BASE_DIR / "data" / "image_manifest.json"
+IMAGE_REVALIDATE_DAYS = float(os.environ.get("IMAGE_REVALIDATE_DAYS", "7"))
+TIMESTAMP_FORMAT = "%d-%m-%Y-%H:%M"  # same format as now_timestamp()
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS, thread_name_prefix="image-download")
+_image_session: requests.Session | None = None
+# name path -> stored path, or "" if the download failed
+_image_downloads: dict[str, Future] = {}
+_image_manifest: dict[str, dict] | None = None
+_image_manifest_dirty = False
+_image_lock = threading.Lock()
+# re-entered when write_json, settling the manifest itself, finds nothing left to save
+_image_manifest_write_lock = threading.RLock()
+
+
+def _manifest() -> dict[str, dict]:
+    # callers hold _image_lock
+    global _image_manifest
+    if _image_manifest is None:
+        _image_manifest = {}
+        if IMAGE_MANIFEST_PATH.exists():
+            with IMAGE_MANIFEST_PATH.open(encoding="utf-8") as f:
+                _image_manifest = json.load(f)
+    return _image_manifest
+
+
 def download_image_cached(
     image_url: str,
     product_name: str,
@@ -132,22 +368,206 @@ def download_image_cached(
     image_url = _normalize_image_url(image_url, base_url)
 
     filename = re.sub(r"[^a-z0-9]", "_", product_name.lower()) + ".webp"
-    save_path = image_dir / filename
-    image_dir.mkdir(parents=True, exist_ok=True)
-
     normalized_prefix = public_prefix.rstrip("/")
-    cached_path = f"{normalized_prefix}/{filename}"
-
-    if save_path.exists():
-        return cached_path
-
+    name_path = f"{normalized_prefix}/{filename}"
+
+    with _image_lock:
+        entry = _manifest().get(name_path)
+        if not (entry and entry["url"] == image_url and (PUBLIC_DIR / entry["path"].lstrip("/")).exists()):
+            entry = None
+        elif not _needs_revalidation(entry):
+            return entry["path"]
+        if name_path not in _image_downloads:
+            _image_downloads[name_path] = _image_executor.submit(
+                _download_image, image_url, product_name, name_path, entry, image_dir / filename, timeout, _prefix()
+            )
+    # stands in for the stored path until write_json swaps it
+    return name_path
+
+
+def _needs_revalidation(entry: dict) -> bool:
     try:
-        response = requests.get(image_url, timeout=timeout)
+        fetched_at = datetime.datetime.strptime(entry["fetched_at"], TIMESTAMP_FORMAT)
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.datetime.now() - fetched_at >= datetime.timedelta(days=IMAGE_REVALIDATE_DAYS)
+
+
+def _download_image(image_url: str, product_name: str, name_path: str, entry: dict | None, legacy_path: Path,
+                    timeout: int, prefix: str) -> str:
+    # `entry` is the manifest entry being revalidated: same URL, stored image still on disk
+    global _image_session, _image_manifest_dirty
+    with _image_lock:
+        if _image_session is None:
+            _image_session = http_session(pool_size=IMAGE_DOWNLOAD_WORKERS)
+        session = _image_session
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    # warnings carry the prefix of the scraper that queued the download
+    _log_scope.prefix = prefix
+    content = None
+    validators: dict[str, str | None] = {}
+    try:
+        with domain_slot(f"images:{urlsplit(image_url).hostname}", IMAGE_DOWNLOADS_PER_HOST):
+            response = session.get(image_url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry:
+            with _image_lock:
+                _manifest()[name_path] = entry | {"fetched_at": now_timestamp()}
+                _image_manifest_dirty = True
+            return entry["path"]
         if response.status_code == 200:
-            save_path.write_bytes(response.content)
-            return cached_path
+            content = to_webp(response.content)
+            validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
     except Exception as e:
         warn(f"Could not download image for '{product_name}': {e}")
 
-    return ""
+    if content is None and entry:
+        # keep the image we have; the entry stays due, so the next run checks again
+        return entry["path"]
+
+    fetched = content is not None
+    if not fetched and legacy_path.exists():
+        # an image saved under its product name before the store existed still beats none; the URL isn't
+        # recorded, so the next run tries the download again
+        try:
+            content = to_webp(legacy_path.read_bytes())
+        except Exception:
+            pass
+    if content is None:
+        return ""
 
+    stored_path = _store_image(content)
+    with _image_lock:
+        _manifest()[name_path] = {
+            "url": image_url if fetched else None,
+            "path": stored_path,
+            "etag": validators.get("etag"),
+            "last_modified": validators.get("last_modified"),
+            "fetched_at": now_timestamp(),
+        }
+        _image_manifest_dirty = True
+    return stored_path
+
+
+def _store_image(content: bytes) -> str:
+    name = hashlib.sha256(content).hexdigest()[:20] + ".webp"
+    save_path = IMAGE_STORE_DIR / name
+    if not save_path.exists():
+        IMAGE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        # write under a temporary name so an interrupted run never leaves a truncated image that looks stored
+        partial_path = save_path.with_name(f"{name}.{threading.get_ident()}.part")
+        partial_path.write_bytes(content)
+        partial_path.replace(save_path)
+    return f"{IMAGE_STORE_PREFIX}/{name}"
+
+
+def _images_ready(data: Any) -> bool:
+    # whether every download referenced in `data` has finished, i.e. settling it won't block
+    with _image_lock:
+        if not _image_downloads:
+            return True
+        downloads = dict(_image_downloads)
+
+    def ready(value: Any) -> bool:
+        if isinstance(value, str):
+            download = downloads.get(value)
+            return download is None or download.done()
+        if isinstance(value, dict):
+            return all(ready(v) for v in value.values())
+        if isinstance(value, list):
+            return all(ready(v) for v in value)
+        return True
+
+    return ready(data)
+
+
+def _settle_images(data: Any, *, save_manifest: bool = True) -> Any:
+    # wait for the downloads referenced in `data` and swap in the stored paths ("" where a download failed)
+    with _image_lock:
+        if not _image_downloads:
+            return data
+        downloads = dict(_image_downloads)
+
+    def settle(value: Any) -> Any:
+        if isinstance(value, str):
+            download = downloads.get(value)
+            return value if download is None else download.result()
+        if isinstance(value, dict):
+            return {k: settle(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [settle(v) for v in value]
+        return value
+
+    settled = settle(data)
+    if save_manifest:
+        _save_manifest()
+    return settled
+
+
+def _save_manifest() -> None:
+    global _image_manifest_dirty
+    with _image_manifest_write_lock:
+        with _image_lock:
+            if not _image_manifest_dirty:
+                return
+            _image_manifest_dirty = False
+            manifest = dict(sorted(_manifest().items()))
+        write_json(IMAGE_MANIFEST_PATH, manifest, compact=True)
+
+
+def wait_for_image_downloads() -> None:
+    # for callers that need every queued image on disk, not just the ones a write referenced
+    with _image_lock:
+        downloads = list(_image_downloads.values())
+    for download in downloads:
+        download.result()
+    _save_manifest()
+
+
+def collect_image_garbage(*, dry_run: bool = False) -> tuple[int, int]:
+    # delete every image no offer file references — images of delisted products, and the per-name files from
+    # before the store — and forget them in the manifest. returns (files deleted, bytes freed)
+    global _image_manifest_dirty
+    referenced: set[str] = set()
+
+    def collect(value: Any) -> None:
+        if isinstance(value, str) and value.startswith("/images/"):
+            referenced.add(value)
+        elif isinstance(value, dict):
+            for v in value.values():
+                collect(v)
+        elif isinstance(value, list):
+            for v in value:
+                collect(v)
+
+    offer_files = sorted((BASE_DIR / "data").glob("*/*_offers.json"))
+    if not offer_files:
+        raise RuntimeError("No offer files found; refusing to treat every image as unreferenced")
+    for path in offer_files:
+        with path.open(encoding="utf-8") as f:
+            collect(json.load(f))
+
+    deleted = freed = 0
+    for path in sorted(IMAGE_ROOT.rglob("*")):
+        if not path.is_file() or path.suffix not in (".webp", ".part"):
+            continue
+        if "/" + path.relative_to(PUBLIC_DIR).as_posix() in referenced:
+            continue
+        deleted += 1
+        freed += path.stat().st_size
+        if not dry_run:
+            path.unlink()
+
+    if not dry_run:
+        with _image_lock:
+            manifest = _manifest()
+            for name_path in [n for n, entry in manifest.items() if entry["path"] not in referenced]:
+                del manifest[name_path]
+                _image_manifest_dirty = True
+        _save_manifest()
+    return deleted, freed
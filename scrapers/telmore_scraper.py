@@ -1,14 +1,20 @@
 import re
-from bs4 import BeautifulSoup
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log
+from playwright.sync_api import ViewportSize
+from detail_cache import DetailCache, fingerprint
+from html_parsing import parse_html
+from page_pool import PagePool
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_monthly, parse_price
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log
 
 # setup
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data" / "telmore"
 IMAGE_DIR = BASE_DIR / "public" / "images" / "telmore"
 OUTPUT_PATH = DATA_DIR / "telmore_offers.json"
+DETAIL_CACHE_PATH = DATA_DIR / "telmore_detail_cache.json"
 VIEWPORT: ViewportSize = {"width": 1920, "height": 10000}
 
 
@@ -19,8 +25,10 @@ def download_image(image_url, product_name):
 def scrape_detail_page(page, url):
     try:
         page.goto(url, timeout=60000, wait_until="domcontentloaded")
-        page.wait_for_timeout(2500)
-        soup = BeautifulSoup(page.content(), 'html.parser')
+        # ready once the monthly subscription price has rendered
+        wait_until_ready(page, "telmore detail", 2500,
+                         js="() => [...document.querySelectorAll('strong')].some(s => /\\d+\\s*kr\\.\\/md/i.test(s.textContent))")
+        soup = parse_html(page.content(), f"telmore detail {url}")
     except Exception as e:
         log(f"  [WARN] Could not load detail page {url}: {e}")
         return None
@@ -29,42 +37,50 @@ def scrape_detail_page(page, url):
 
     subscription_price_monthly = None
     for strong in soup.find_all('strong'):
-        m = re.search(r'(\d+)\s*kr\./md', strong.get_text(strip=True), re.IGNORECASE)
-        if m:
-            subscription_price_monthly = int(m.group(1))
+        subscription_price_monthly = parse_monthly(strong.get_text(strip=True))
+        if subscription_price_monthly is not None:
             break
     return subscription_price_monthly
 
 
-def scrape_telmore():
+def make_page(browser):
+    # very tall viewport to load images for all products
+    context = browser.new_context(viewport=VIEWPORT)
+    # images stay: the listing relies on them lazy-loading into view (hence the tall viewport)
+    block_unneeded_requests(context, "telmore", blocked_types=frozenset({"media", "font"}))
+    return context, context.new_page()
+
+
+def scrape_telmore(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
     url = "https://www.telmore.dk/shop/mobiltelefoner"
     date_time = now_timestamp()
+    cache = DetailCache(DETAIL_CACHE_PATH)
+    listed_links: set[str] = set()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=["--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage"]
-        )
-        # very tall viewport to load images for all products
-        page = browser.new_page(viewport=VIEWPORT)
+    with browser_session(browser) as browser:
+        context, page = make_page(browser)
         try:
             page.goto(url, timeout=60000, wait_until="domcontentloaded")
             page.wait_for_selector('div.carousel-image-wrapper')
-            page.wait_for_timeout(3000)
+            # let the lazy-loaded carousel images settle
+            wait_until_ready(page, "telmore listing", 3000, dom_stable_ms=500)
         except Exception as e:
             log(f"[WARN] Could not load Telmore listing page {url}: {e}")
-            browser.close()
+            context.close()
             write_json(OUTPUT_PATH, [])
             log("Exported 0 offers due to page load failure")
             return
         html = page.content()
+        context.close()
 
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = parse_html(html, "telmore listing")
         offer_list = soup.find_all('div', class_='col-md-6 col-12')
         scraped_data = []
+        # (item, card fingerprint) for every product whose detail page has to be visited
+        to_visit: list[tuple[dict, str]] = []
 
         for offer in offer_list:
             item = {
@@ -109,50 +125,71 @@ def scrape_telmore():
             # price with subscription
             price_tag = offer.find('span', class_='tlm-product-list-card__price')
             if price_tag:
-                price_val = "".join(re.findall(r'\d+', price_tag.get_text()))
-                if price_val:
-                    item["price_with_subscription"] = int(price_val)
+                price_val = parse_price(price_tag.get_text())
+                if price_val is not None:
+                    item["price_with_subscription"] = price_val
 
             # discount
             discount_span = offer.find('span', string=re.compile(r'Mobilrabat', re.IGNORECASE))
             if discount_span:
-                discount_val = "".join(re.findall(r'\d+', discount_span.get_text()))
-                if discount_val:
-                    item["discount_on_product"] = int(discount_val)
+                discount_val = parse_price(discount_span.get_text())
+                if discount_val is not None:
+                    item["discount_on_product"] = discount_val
 
             # min price
             min_price_span = offer.find('span', string=re.compile(r'Mindstepris', re.IGNORECASE))
             if min_price_span:
-                min_val = "".join(re.findall(r'\d+', min_price_span.get_text()))
-                if min_val:
-                    item["min_cost_6_months"] = int(min_val)
+                min_val = parse_min_cost(min_price_span.get_text())
+                if min_val is not None:
+                    item["min_cost_6_months"] = min_val
 
             # calculate price without subscription
             if item["price_with_subscription"] and item["discount_on_product"]:
                 item["price_without_subscription"] = item["price_with_subscription"] + item["discount_on_product"]
 
-            # subscription monthly price — requires visiting detail page
-            if item["link"]:
-                item["subscription_price_monthly"] = scrape_detail_page(page, item["link"])
-
             if "brugt" in item["product_name"].lower():
                 log(f"  Skipping used product: {item['product_name']}")
                 continue
 
-            def fmt(value):
-                return value if value not in (None, "") else "-"
+            # subscription monthly price — requires visiting the detail page, unless the card is unchanged since
+            # the last visit
+            if item["link"]:
+                listed_links.add(item["link"])
+                card_print = fingerprint(
+                    item["product_name"],
+                    price_tag.get_text(strip=True) if price_tag else "",
+                    discount_span.get_text(strip=True) if discount_span else "",
+                    item["link"],
+                )
+                item["subscription_price_monthly"] = cache.get(item["link"], card_print)
+                if item["subscription_price_monthly"] is None:
+                    to_visit.append((item, card_print))
 
             scraped_data.append(item)
-            log(
-                f"  {item['product_name']}: "
-                f"sub={fmt(item['price_with_subscription'])}, "
-                f"rabat={fmt(item['discount_on_product'])}, "
-                f"kontant={fmt(item['price_without_subscription'])}, "
-                f"min6={fmt(item['min_cost_6_months'])}, "
-                f"md={fmt(item['subscription_price_monthly'])}"
-            )
-
-        browser.close()
+
+        pool = PagePool(browser, make_page, name="telmore", domain="telmore.dk")
+        visited = pool.map([item["link"] for item, _ in to_visit], scrape_detail_page)
+        for (item, card_print), monthly in zip(to_visit, visited):
+            item["subscription_price_monthly"] = monthly
+            if monthly is not None:
+                cache.put(item["link"], card_print, monthly)
+
+    def fmt(value):
+        return value if value not in (None, "") else "-"
+
+    for item in scraped_data:
+        log(
+            f"  {item['product_name']}: "
+            f"sub={fmt(item['price_with_subscription'])}, "
+            f"rabat={fmt(item['discount_on_product'])}, "
+            f"kontant={fmt(item['price_without_subscription'])}, "
+            f"min6={fmt(item['min_cost_6_months'])}, "
+            f"md={fmt(item['subscription_price_monthly'])}"
+        )
+
+    cache.prune(listed_links)
+    cache.save()
+    log(f"Detail pages reused from the last run: {cache.hits}, visited: {cache.misses}")
 
     # save results to JSON file
     write_json(OUTPUT_PATH, scraped_data)
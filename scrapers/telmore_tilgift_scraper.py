@@ -1,14 +1,20 @@
 import re
-from bs4 import BeautifulSoup
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log, offer_summary
+from playwright.sync_api import ViewportSize
+from detail_cache import DetailCache, fingerprint
+from html_parsing import parse_html
+from page_pool import PagePool
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_monthly, parse_price
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log, offer_summary
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 BASE_URL = "https://www.telmore.dk"
 DATA_DIR = BASE_DIR / "data" / "telmore"
 IMAGE_DIR = BASE_DIR / "public" / "images" / "telmore"
 OUTPUT_PATH = DATA_DIR / "telmore_tilgift_offers.json"
+DETAIL_CACHE_PATH = DATA_DIR / "telmore_tilgift_detail_cache.json"
 VIEWPORT: ViewportSize = {"width": 1920, "height": 1080}
 
 
@@ -22,9 +28,10 @@ def _bs4_str(value: object) -> str:
 
 def scrape_detail_page(page, url):
     page.goto(url, timeout=60000, wait_until="domcontentloaded")
-    page.wait_for_timeout(2500)
+    # the price block renders client-side; ready once it has the minimum cost and stops changing
+    wait_until_ready(page, "telmore_tilgift detail", 2500, selector="text=/Mindstepris/", dom_stable_ms=300)
     html = page.content()
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html, f"telmore_tilgift detail {url}")
 
     min_cost_6_months = None
     discount_on_product = None
@@ -35,31 +42,21 @@ def scrape_detail_page(page, url):
     for p in soup.find_all('p'):
         classes = p.get('class') or []
         if 'text--xs' in classes or 'mb-0' in classes:
-            text = p.get_text(strip=True)
-            m = re.search(r'Mindstepris\s*:\s*(\d[\d.]*)\s*kr', text, re.IGNORECASE)
-            if m:
-                min_cost_6_months = int(m.group(1).replace('.', ''))
-            else:
-                m = re.search(r'Mindstepris\s+kr\.?\s*:\s*(\d+)', text, re.IGNORECASE)
-                if m:
-                    min_cost_6_months = int(m.group(1))
+            # "Mindstepris: 2.299 kr" or "Mindstepris kr.: 2299"
+            min_cost_6_months = parse_min_cost(p.get_text(strip=True))
             break
 
     # discount
     for span in soup.find_all('span'):
         span_text = span.get_text(strip=True)
         if re.search(r'Mobilrabat|Rabat', span_text, re.IGNORECASE):
-            discount_val = "".join(re.findall(r'\d+', span_text))
-            if discount_val:
-                discount_on_product = int(discount_val)
+            discount_on_product = parse_price(span_text)
             break
 
     # subscription monthly price
     for strong in soup.find_all('strong'):
-        t = strong.get_text(strip=True)
-        m = re.search(r'(\d+)\s*kr\./md', t, re.IGNORECASE)
-        if m:
-            subscription_price_monthly = int(m.group(1))
+        subscription_price_monthly = parse_monthly(strong.get_text(strip=True))
+        if subscription_price_monthly is not None:
             break
 
     # img
@@ -80,31 +77,39 @@ def scrape_detail_page(page, url):
     return min_cost_6_months, discount_on_product, subscription_price_monthly, image_url
 
 
-def scrape_telmore_tilgift():
+def make_page(browser):
+    context = browser.new_context(viewport=VIEWPORT)
+    block_unneeded_requests(context, "telmore_tilgift", blocked_types=frozenset({"media", "font"}))
+    return context, context.new_page()
+
+
+def scrape_telmore_tilgift(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
     listing_url = "https://www.telmore.dk/shop/tilgift/"
     date_time = now_timestamp()
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=["--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage"]
-        )
-        page = browser.new_page(viewport=VIEWPORT)
-
-        # scrape listing page
-        log(f"Loading listing: {listing_url}")
-        page.goto(listing_url, timeout=60000, wait_until="domcontentloaded")
-        page.wait_for_timeout(3000)
-        listing_html = page.content()
-        soup = BeautifulSoup(listing_html, 'html.parser')
+    cache = DetailCache(DETAIL_CACHE_PATH)
+    listed_links: set[str] = set()
+
+    with browser_session(browser) as browser:
+        context, page = make_page(browser)
+        try:
+            # scrape listing page
+            log(f"Loading listing: {listing_url}")
+            page.goto(listing_url, timeout=60000, wait_until="domcontentloaded")
+            wait_until_ready(page, "telmore_tilgift listing", 3000, selector="div.tlm-product-list-card", dom_stable_ms=500)
+            listing_html = page.content()
+        finally:
+            context.close()
+        soup = parse_html(listing_html, "telmore_tilgift listing")
 
         cards = soup.find_all('div', class_='tlm-product-list-card')
         log(f"Found {len(cards)} tilgift offers")
 
-        scraped_data = []
+        # (full name, gift price, detail url, card fingerprint) per card, and the detail page results by url
+        listed: list[tuple[str, int | None, str, str]] = []
+        details: dict[str, tuple] = {}
 
         for card in cards:
             name_tag = card.find('strong', class_='h4')
@@ -121,63 +126,87 @@ def scrape_telmore_tilgift():
             # Product price (what you pay for the gift item)
             product_price = None
             if price_tag:
-                price_text = _bs4_str(price_tag.get_text(strip=True))
-                val = "".join(re.findall(r'\d+', price_text))
-                if val:
-                    product_price = int(val)
+                product_price = parse_price(_bs4_str(price_tag.get_text(strip=True)))
 
             href = _bs4_str(link_tag.get('href')) if link_tag else ""
             detail_url = (BASE_URL + href) if href.startswith('/') else href
 
-            min_cost_6_months, discount_on_product, subscription_price_monthly, image_url = scrape_detail_page(page, detail_url)
-
-            # Download image
-            local_image = download_image(image_url, full_name) if image_url else ""
-
-            name_lower = full_name.lower()
-            if "tab" in name_lower:
-                product_type = "tablet"
-            elif "beoplay" in name_lower or "airpods" in name_lower:
-                product_type = "sound"
-            else:
-                product_type = "gift"
-
-            # price_with_subscription = what you pay for the gift item
-            price_with_subscription = product_price
-            # price_without_subscription = gift price before subscription discount
-            price_without_subscription = None
-            if price_with_subscription is not None and discount_on_product is not None:
-                price_without_subscription = price_with_subscription + discount_on_product
-
-            item = {
-                "link": detail_url,
-                "product_name": full_name,
-                "image_url": local_image,
-                "provider": "Telmore",
-                "type": product_type,
-                "price_without_subscription": price_without_subscription,
-                "price_with_subscription": price_with_subscription,
-                "subscription_price_monthly": subscription_price_monthly,
-                "discount_on_product": discount_on_product,
-                "min_cost_6_months": min_cost_6_months,
-                "saved_at": date_time
-            }
-
-            if "brugt" in full_name.lower():
-                log(f"  Skipping used product: {full_name}")
-                continue
-
-            scraped_data.append(item)
-            offer_summary(
+            # the detail page is only visited when the card changed since the last visit
+            discount_tag = card.find('span', string=re.compile(r'Mobilrabat|Rabat', re.IGNORECASE))
+            card_print = fingerprint(
                 full_name,
-                sub=price_with_subscription,
-                rabat=discount_on_product,
-                kontant=price_without_subscription,
-                min6=min_cost_6_months,
-                md=subscription_price_monthly,
+                price_tag.get_text(strip=True) if price_tag else "",
+                discount_tag.get_text(strip=True) if discount_tag else "",
+                detail_url,
             )
+            listed_links.add(detail_url)
+            listed.append((full_name, product_price, detail_url, card_print))
+            cached = cache.get(detail_url, card_print)
+            if cached is not None:
+                details[detail_url] = tuple(cached)
+
+        to_visit = {detail_url: card_print for _, _, detail_url, card_print in listed if detail_url not in details}
+        pool = PagePool(browser, make_page, name="telmore_tilgift", domain="telmore.dk")
+        visited = pool.map(list(to_visit), scrape_detail_page)
+        for (detail_url, card_print), detail in zip(to_visit.items(), visited):
+            details[detail_url] = detail or (None, None, None, "")
+            if detail and detail[0] is not None:
+                cache.put(detail_url, card_print, list(detail))
+
+    scraped_data = []
+
+    for full_name, product_price, detail_url, _ in listed:
+        min_cost_6_months, discount_on_product, subscription_price_monthly, image_url = details[detail_url]
+
+        # Download image
+        local_image = download_image(image_url, full_name) if image_url else ""
+
+        name_lower = full_name.lower()
+        if "tab" in name_lower:
+            product_type = "tablet"
+        elif "beoplay" in name_lower or "airpods" in name_lower:
+            product_type = "sound"
+        else:
+            product_type = "gift"
+
+        # price_with_subscription = what you pay for the gift item
+        price_with_subscription = product_price
+        # price_without_subscription = gift price before subscription discount
+        price_without_subscription = None
+        if price_with_subscription is not None and discount_on_product is not None:
+            price_without_subscription = price_with_subscription + discount_on_product
+
+        item = {
+            "link": detail_url,
+            "product_name": full_name,
+            "image_url": local_image,
+            "provider": "Telmore",
+            "type": product_type,
+            "price_without_subscription": price_without_subscription,
+            "price_with_subscription": price_with_subscription,
+            "subscription_price_monthly": subscription_price_monthly,
+            "discount_on_product": discount_on_product,
+            "min_cost_6_months": min_cost_6_months,
+            "saved_at": date_time
+        }
+
+        if "brugt" in full_name.lower():
+            log(f"  Skipping used product: {full_name}")
+            continue
+
+        scraped_data.append(item)
+        offer_summary(
+            full_name,
+            sub=price_with_subscription,
+            rabat=discount_on_product,
+            kontant=price_without_subscription,
+            min6=min_cost_6_months,
+            md=subscription_price_monthly,
+        )
 
-        browser.close()
+    cache.prune(listed_links)
+    cache.save()
+    log(f"Detail pages reused from the last run: {cache.hits}, visited: {cache.misses}")
 
     write_json(OUTPUT_PATH, scraped_data)
 
@@ -0,0 +1,81 @@
+import pytest
+from price_parsing import Promo, parse_min_cost, parse_monthly, parse_price, parse_promo
+
+# texts seen on the providers' pages and what they parse to: (text, parse_price, parse_monthly, parse_min_cost,
+# parse_promo)
+CORPUS: list[tuple[str, int | None, int | None, int | None, Promo | None]] = [
+    ("4.299 kr.", 4299, None, None, None),
+    ("10.899,00 kr.", 10899, None, None, None),
+    ("4.299,-", 4299, None, None, None),
+    ("1.064 kr.", 1064, None, None, None),
+    ("Fra 4\xa0299 kr.", 4299, None, None, None),
+    ("4 299 kr.", 4299, None, None, None),
+    ("Fra 12 999 kr.", 12999, None, None, None),
+    ("99 kr.", 99, None, None, None),
+    ("Mobilrabat 1.100 kr.", 1100, None, None, None),
+    ("Rabat\xa0500\xa0kr.", 500, None, None, None),
+    ("39 kr./md.", 39, 39, None, None),
+    ("299 kr./md", 299, 299, None, None),
+    ("129 kr. / md.", 129, 129, None, None),
+    ("Mindstepris 5.022 kr. med 79 kr. i 6 mdr. herefter 129 kr.", 5022, None, 5022, Promo(79, 6, 129)),
+    ("Mindstepris inkl. 6 mdr. abonnement 2.299 kr.", 2299, None, 2299, None),
+    ("Mindstepris 6 mdr. 3.593 kr.", 3593, None, 3593, None),
+    ("Mindstepris 6 mdr.: 3.593", 6, None, 3593, None),
+    ("Mindstepris: 2.299 kr", 2299, None, 2299, None),
+    ("Mindstepris kr.: 2299", 2299, None, 2299, None),
+    ("Mindstepris inkl. 6 mdr. abonnement", 6, None, None, None),
+    ("Mindstepris i 6 måneder", 6, None, None, None),
+    ("39 kr./md. i 2 md. - Herefter 129 kr.", 39, 39, None, Promo(39, 2, 129)),
+    ("39 kr./md. i 2 md. – herefter 1.129 kr.", 39, 39, None, Promo(39, 2, 1129)),
+    ("", None, None, None, None),
+    ("Udsolgt", None, None, None, None),
+]
+
+AMOUNTS = [*range(0, 2000), *range(2000, 100_000, 7), 999_999, 1_000_000, 12_345_678]
+
+
+def _danish(amount: int, decimals: bool = False, sep: str = ".") -> str:
+    text = f"{amount:,}".replace(",", sep)
+    return text + ",00" if decimals else text
+
+
+@pytest.mark.parametrize("text, price, monthly, min_cost, promo", CORPUS)
+def test_corpus(text, price, monthly, min_cost, promo):
+    assert parse_price(text) == price
+    assert parse_monthly(text) == monthly
+    assert parse_min_cost(text) == min_cost
+    assert parse_promo(text) == promo
+
+
+def test_none():
+    assert parse_price(None) is None
+    assert parse_monthly(None) is None
+    assert parse_min_cost(None) is None
+    assert parse_promo(None) is None
+
+
+def test_promo_cost():
+    assert Promo(79, 6, 129).cost() == 6 * 79
+    assert Promo(39, 2, 129).cost() == 2 * 39 + 4 * 129
+    assert Promo(39, 2, 129).cost(months=1) == 39
+
+
+@pytest.mark.parametrize("fmt", ["{} kr.", "{},00 kr.", "{},-", "Mindstepris {} kr.", "{} kr./md."])
+def test_amounts_round_trip(fmt):
+    # any amount, however it is printed, parses back to itself
+    for amount in AMOUNTS:
+        text = fmt.format(_danish(amount))
+        assert parse_price(text) == amount, text
+
+
+@pytest.mark.parametrize("sep", [" ", "\xa0"])
+def test_space_grouped_round_trip(sep):
+    for amount in AMOUNTS:
+        text = f"{_danish(amount, sep=sep)} kr."
+        assert parse_price(text) == amount, text
+
+
+def test_promo_round_trip():
+    for amount in AMOUNTS:
+        text = f"{amount} kr. i 3 mdr. herefter {_danish(amount + 1)} kr."
+        assert parse_promo(text) == Promo(amount, 3, amount + 1), text
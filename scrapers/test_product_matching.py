@@ -0,0 +1,26 @@
+import json
+import pytest
+from match_benchmark import REGRESSION_CORPUS, load_corpus, pick, regressions
+from product_matching import score_match
+
+# hand-checked cases the engine once got wrong, see match_regressions.jsonl
+CASES = load_corpus(REGRESSION_CORPUS)
+
+
+@pytest.mark.parametrize("case", CASES, ids=[json.dumps(c["query"]) for c in CASES])
+def test_regression_corpus(case):
+    chosen = pick(case)
+    assert chosen in case["expected"] if case["expected"] else chosen is None
+
+
+def test_no_regressions_against_baselines():
+    assert regressions(CASES) == []
+
+
+def test_phone_model_is_not_a_screen_size():
+    # on a phone a bare "16" is the model number, so the 16e is a different device
+    assert score_match("iPhone 16 128GB", "Apple iPhone 16e 128GB") == 0.0
+
+
+def test_tablet_screen_size_is_not_a_model():
+    assert score_match("Apple iPad 11 128GB", "Apple iPad 11\" 128GB WiFi") > 0.0
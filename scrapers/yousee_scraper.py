@@ -1,8 +1,10 @@
-import re
 import dataclasses
 from pathlib import Path
-from playwright.sync_api import ViewportSize, sync_playwright
-from scraper_utils import download_image_cached, now_timestamp, write_json, log
+from playwright.sync_api import ViewportSize
+from page_waits import wait_until_ready
+from price_parsing import parse_min_cost, parse_price
+from request_filter import block_unneeded_requests
+from scraper_utils import browser_session, download_image_cached, now_timestamp, write_json, log
 
 BASE_DIR  = Path(__file__).parent.parent
 IMAGE_DIR = BASE_DIR / "public" / "images" / "yousee"
@@ -49,14 +51,6 @@ class Offer:
     saved_at: str = ""
 
 
-def parse_price(text: str) -> int | None:
-    # return price
-    if not text:
-        return None
-    digits = re.sub(r"\D", "", text.replace(".", ""))
-    return int(digits) if digits else None
-
-
 def download_image(image_url: str, product_name: str) -> str:
     # download image if it doesn't exist
     return download_image_cached(image_url, product_name, IMAGE_DIR, "/images/yousee")
@@ -65,7 +59,7 @@ def download_image(image_url: str, product_name: str) -> str:
 def accept_cookies(page) -> None:
     try:
         page.click(COOKIE_ACCEPT_SELECTOR, timeout=4000)
-        page.wait_for_timeout(1200)
+        wait_until_ready(page, "yousee cookie banner closed", 1200, selector=COOKIE_ACCEPT_SELECTOR, state="hidden")
     except Exception:
         pass  # banner may already be dismissed
 
@@ -119,11 +113,8 @@ def extract_card(card, product_type: str, saved_at: str, storage_label: str = ""
     min_price_el = card.query_selector("div.product-card__min-price")
     min_cost_6_months = None
     if min_price_el:
-        raw_min = min_price_el.inner_text()
-        # grab the last number to avoid picking up "6" from "6 mdr."
-        nums = re.findall(r"(\d{1,3}(?:\.\d{3})+|\d{4,})", raw_min)
-        if nums:
-            min_cost_6_months = int(nums[-1].replace(".", ""))
+        # the kroner amount, not the "6" from "6 mdr."
+        min_cost_6_months = parse_min_cost(min_price_el.inner_text())
 
     # monthly price derived from: (min_cost_6_months - price_with_subscription) / 6
     subscription_price_monthly = None
@@ -159,7 +150,7 @@ def scrape_listing_page(page, cat_url: str, product_type: str, saved_at: str, se
 
     try:
         page.goto(cat_url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2500)
+        wait_until_ready(page, "yousee listing", 2500, selector='div[class*="taProductCard"]')
     except Exception as e:
         log(f"  Could not load {cat_url}: {e}")
         return
@@ -169,9 +160,9 @@ def scrape_listing_page(page, cat_url: str, product_type: str, saved_at: str, se
 
     # Scroll to bottom to ensure all lazy-loaded cards are rendered
     page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-    page.wait_for_timeout(1500)
+    wait_until_ready(page, "yousee listing scroll", 1500, dom_stable_ms=400)
     page.evaluate("window.scrollTo(0, 0)")
-    page.wait_for_timeout(500)
+    wait_until_ready(page, "yousee listing scroll back", 500, dom_stable_ms=200)
 
     # All product cards carry the taProductCard marker class
     cards = page.query_selector_all('div[class*="taProductCard"]')
@@ -185,7 +176,7 @@ def scrape_listing_page(page, cat_url: str, product_type: str, saved_at: str, se
 
 
 
-def scrape_yousee():
+def scrape_yousee(browser=None):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -193,8 +184,7 @@ def scrape_yousee():
     all_offers: list[Offer] = []
     seen_names: set[str]    = set()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
+    with browser_session(browser) as browser:
         context = browser.new_context(
             user_agent=(
                 "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -204,24 +194,25 @@ def scrape_yousee():
             viewport=VIEWPORT,
             locale="da-DK",
         )
-        page = context.new_page()
-
-        # Accept cookies once on the homepage so the banner doesn't reappear
-        log("Accepting cookies on homepage...")
-        page.goto(BASE_URL, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2000)
-        accept_cookies(page)
-
-        # scrape phone listing pages once per storage size
-        for cat_url, storage_label in PHONE_STORAGE_URLS.items():
-            scrape_listing_page(page, cat_url, "phone", saved_at, seen_names, all_offers, storage_label)
-
-        # scrape the remaining category listing pages
-        for cat_url, product_type in CATEGORY_URLS.items():
-            scrape_listing_page(page, cat_url, product_type, saved_at, seen_names, all_offers)
-
-        context.close()
-        browser.close()
+        try:
+            block_unneeded_requests(context, "yousee")
+            page = context.new_page()
+
+            # Accept cookies once on the homepage so the banner doesn't reappear
+            log("Accepting cookies on homepage...")
+            page.goto(BASE_URL, wait_until="networkidle", timeout=30000)
+            wait_until_ready(page, "yousee cookie banner", 2000, selector=COOKIE_ACCEPT_SELECTOR)
+            accept_cookies(page)
+
+            # scrape phone listing pages once per storage size
+            for cat_url, storage_label in PHONE_STORAGE_URLS.items():
+                scrape_listing_page(page, cat_url, "phone", saved_at, seen_names, all_offers, storage_label)
+
+            # scrape the remaining category listing pages
+            for cat_url, product_type in CATEGORY_URLS.items():
+                scrape_listing_page(page, cat_url, product_type, saved_at, seen_names, all_offers)
+        finally:
+            context.close()
 
     # save results
     output_path = DATA_DIR / "yousee_offers.json"